@@ -0,0 +1,537 @@
+"""Stage-level benchmarks for FlashyGen, with a deterministic stand-in for the LLM.
+
+Runs extraction, splitting and the full /flashcard/ path over the documents in study/ and over
+synthetic PDF, DOCX, PPTX and CSV files of several sizes, and reports wall time, throughput and
+peak memory per stage, and the resident memory each /flashcard/ request adds to the server and its
+extraction workers. No Groq API key or network access is needed.
+
+    python benchmark.py --sizes 10,100,500 --latency-ms 50
+    python benchmark.py --compare .flashygen/benchmark-<commit>.json
+
+Results are saved as JSON (by default under .flashygen/, named after the current commit) so runs
+on different commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Optional, get_type_hints
+
+# Benchmarks measure the pipeline itself: no result or chunk caching, no rate limiting,
+# and state kept out of the real data directory. These must be set before main is imported.
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("FLASHYGEN_DATA_DIR", os.path.join(tempfile.gettempdir(), "flashygen-benchmark"))
+for name in ("RESULT_CACHE_PATH", "CHUNK_CACHE_PATH"):
+    os.environ[name] = ""
+for name in ("RESULT_CACHE_MEMORY_BYTES", "CHUNK_CACHE_MEMORY_BYTES"):
+    os.environ[name] = "0"
+for name in ("LLM_REQUESTS_PER_MINUTE", "LLM_TOKENS_PER_MINUTE", "ESCALATION_REQUESTS_PER_MINUTE", "ESCALATION_TOKENS_PER_MINUTE"):
+    os.environ[name] = "0"
+
+import httpx
+from langchain_core.messages import AIMessage
+import main
+from chunking import IncrementalSplitter, count_tokens, make_splitter
+from extractors import EXTRACTORS, extract_text
+from uploads import Upload
+
+STAGES = ("extract", "split", "generate", "stream")
+
+# Piece sizes, in characters, the split stage feeds text in to check the server's incremental split
+INCREMENTAL_PIECE_CHARS = (997, 5000)
+
+WORDS = (
+    "data analysis warehouse model schema query index table cluster regression variance mean median "
+    "distribution sample population hypothesis test signal noise feature vector matrix network layer "
+    "gradient loss accuracy precision recall memory process thread cache latency throughput storage "
+    "record field column row key value history empire trade route dynasty army city river mountain "
+    "energy cell protein enzyme membrane nucleus gene evolution species habitat climate carbon oxygen"
+).split()
+
+
+# Deterministic stand-in for a structured-output LLM: after `latency` seconds it returns two
+# schema-valid cards per chunk (per section for packed prompts), built from the chunk's sentences
+class FakeStructuredLLM:
+    def __init__(self, schema, latency: float, include_raw: bool = False):
+        self.card_fields = get_type_hints(get_type_hints(schema)["flashcards"].__args__[0])
+        self.latency = latency
+        self.include_raw = include_raw
+        self.calls = 0
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        prompt = str(prompt)
+        sections = re.split(r"^Section \d+:\n", prompt, flags=re.MULTILINE)[1:]
+        if not sections:
+            sections = [prompt.split("Text:", 1)[-1]]
+        flashcards = []
+        for number, text in enumerate(sections, 1):
+            sentences = [sentence for sentence in re.split(r"(?<=[.!?])\s+|\n+", text) if len(sentence.split()) >= 4]
+            for sentence in sentences[:2]:
+                card = self.card(sentence.strip())
+                if "section" in self.card_fields:
+                    card["section"] = number
+                flashcards.append(card)
+        parsed = {"flashcards": flashcards}
+        if not self.include_raw:
+            return parsed
+        # Token usage as the real client reports it, at the usual estimate of four characters per token
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(json.dumps(parsed)) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return {"raw": AIMessage(content="", usage_metadata=usage), "parsed": parsed, "parsing_error": None}
+
+    def card(self, sentence: str) -> dict:
+        if "question_with_blanks" in self.card_fields:
+            answer = max(sentence.split(), key=len)
+            return {"question_with_blanks": sentence.replace(answer, "____", 1), "correct_answers": [answer]}
+        return {"question": "What does this state: " + " ".join(sentence.split()[:6]) + "?", "answer": sentence}
+
+
+class FakeChatModel:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.structured = {}
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        return self.structured.setdefault(schema.__name__, FakeStructuredLLM(schema, self.latency, include_raw))
+
+
+# Synthetic documents: deterministic pseudo-prose so runs are comparable across commits
+def sentences(rng: random.Random, count: int) -> list:
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + "." for _ in range(count)]
+
+def make_pdf(pages: int, rng: random.Random) -> bytes:
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for number in range(pages):
+        # A running header and footer on every page, as lecture notes have, for the boilerplate filter
+        text = ["Synthetic Lecture Notes - Benchmark Course", *textwrap_lines(" ".join(sentences(rng, 24)), 90)[:48], f"Page {number + 1} of {pages}"]
+        lines = [f"({line})'" for line in text]
+        content = ("BT /F1 10 Tf 14 TL 50 770 Td\n" + "\n".join(lines) + "\nET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{i} 0 R" for i in page_ids).encode(), pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+def textwrap_lines(text: str, width: int) -> list:
+    lines, line = [], ""
+    for word in text.split():
+        if len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = ""
+        line = f"{line} {word}" if line else word
+    return lines + [line]
+
+def make_docx(pages: int, rng: random.Random) -> bytes:
+    import docx
+    document = docx.Document()
+    for page in range(pages):
+        document.add_heading(f"Section {page + 1}", level=1)
+        for _ in range(4):
+            document.add_paragraph(" ".join(sentences(rng, 5)))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+def make_pptx(slides: int, rng: random.Random) -> bytes:
+    import pptx
+    presentation = pptx.Presentation()
+    for number in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {number + 1}: " + " ".join(rng.choice(WORDS) for _ in range(3))
+        slide.placeholders[1].text = "\n".join(sentences(rng, 5))
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+# One "page" of CSV is 40 glossary rows
+def make_csv(pages: int, rng: random.Random) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["term", "definition", "category"])
+    for _ in range(pages * 40):
+        writer.writerow([rng.choice(WORDS), sentences(rng, 1)[0], rng.choice(WORDS)])
+    return out.getvalue().encode("utf-8")
+
+SYNTHETIC = {"pdf": make_pdf, "docx": make_docx, "pptx": make_pptx, "csv": make_csv}
+
+# (name, method, size in pages or None, bytes) for every benchmark document
+def load_documents(sizes: list, methods: list, include_study: bool) -> list:
+    documents = []
+    if include_study:
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "study", "*"))):
+            method = os.path.splitext(path)[1].lstrip(".").lower()
+            method = "text" if method == "txt" else method
+            if method in methods or (method == "text" and "text" in methods):
+                with open(path, "rb") as document:
+                    data = document.read()
+                # Empty files (study/sample_text.txt) have nothing to benchmark
+                if data:
+                    documents.append((os.path.basename(path), method, None, data))
+    for method in methods:
+        if method in SYNTHETIC:
+            for size in sizes:
+                data = SYNTHETIC[method](size, random.Random(f"{method}-{size}"))
+                documents.append((f"synthetic-{size}.{method}", method, size, data))
+    return documents
+
+def page_count(method: str, data: bytes):
+    if method == "pdf":
+        import PyPDF2
+        return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    if method == "pptx":
+        import pptx
+        return len(pptx.Presentation(io.BytesIO(data)).slides)
+    return None
+
+def extracted_text(method: str, data: bytes, path: str) -> str:
+    return data.decode("utf-8") if method not in EXTRACTORS else extract_text(method, path)
+
+# Resident memory of this process and its extraction workers in bytes, read from /proc; None where
+# there is no /proc
+def resident_bytes() -> Optional[int]:
+    total = 0
+    for pid in [os.getpid(), *(getattr(main.extraction_pool, "_processes", None) or {})]:
+        try:
+            with open(f"/proc/{pid}/statm") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # A worker may exit between listing and reading; without /proc there is nothing to measure
+            if pid == os.getpid():
+                return None
+    return total
+
+
+class ResidentPeak:
+    """Samples resident_bytes() on a background thread while a block runs and keeps the peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self.done = threading.Event()
+
+    def __enter__(self):
+        self.baseline = self.peak = resident_bytes()
+        if self.baseline is not None:
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.baseline is not None:
+            self.done.set()
+            self.thread.join()
+            self.peak = max(self.peak, resident_bytes() or 0)
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, resident_bytes() or 0)
+
+    def stats(self) -> dict:
+        if self.baseline is None:
+            return {}
+        return {"peak_rss_mb": round(self.peak / 2 ** 20, 1), "rss_growth_mb": round((self.peak - self.baseline) / 2 ** 20, 1)}
+
+
+# Run `run()` once for wall time and, unless disabled, once more under tracemalloc for peak Python memory
+def measure(run, trace_memory: bool) -> dict:
+    started = time.perf_counter()
+    details = run()
+    stats = {"seconds": round(time.perf_counter() - started, 4), **details}
+    if trace_memory:
+        tracemalloc.start()
+        run()
+        stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    return stats
+
+def rate(count, seconds: float):
+    return round(count / seconds, 2) if count is not None and seconds else None
+
+# Split text fed a piece at a time, as the server splits text while it is being extracted
+def split_incrementally(text: str, piece_chars: int) -> list:
+    splitter = IncrementalSplitter()
+    chunks = []
+    for start in range(0, len(text), piece_chars):
+        chunks += splitter.feed(text[start:start + piece_chars])
+    return chunks + splitter.finish()
+
+def benchmark_document(name: str, method: str, data: bytes, args, client_loop) -> dict:
+    # Extraction reads files from disk, as it does for spooled uploads
+    with tempfile.NamedTemporaryFile(suffix=f".{method}") as document_file:
+        document_file.write(data)
+        document_file.flush()
+        return benchmark_file(name, method, data, document_file.name, args, client_loop)
+
+def benchmark_file(name: str, method: str, data: bytes, path: str, args, client_loop) -> dict:
+    stages = {}
+    pages = page_count(method, data)
+    text = extracted_text(method, data, path)
+    splitter = make_splitter()
+
+    if "extract" in args.stages and method in EXTRACTORS:
+        stats = measure(lambda: {"characters": len(extract_text(method, path))}, args.memory)
+        stats["pages_per_second"] = rate(pages, stats["seconds"])
+        stats["mb_per_second"] = rate(len(data) / 2 ** 20, stats["seconds"])
+        stages["extract"] = stats
+
+    if "split" in args.stages:
+        def split():
+            chunks = splitter.split_text(text)
+            return {"chunks": len(chunks), "tokens": sum(count_tokens(chunk) for chunk in chunks)}
+        stats = measure(split, args.memory)
+        stats["chunks_per_second"] = rate(stats["chunks"], stats["seconds"])
+        # The incremental split must cover the whole text with the same chunks as splitting it whole
+        whole = splitter.split_text(text)
+        stats["incremental_mismatches"] = [
+            piece_chars for piece_chars in INCREMENTAL_PIECE_CHARS if split_incrementally(text, piece_chars) != whole
+        ]
+        stages["split"] = stats
+
+    form = {"type": args.type, "method": method}
+    if args.concurrency:
+        form["concurrency"] = str(args.concurrency)
+    if args.pack_tokens is not None:
+        form["pack_tokens"] = str(args.pack_tokens)
+
+    if "generate" in args.stages:
+        # One request, or args.uploads identical requests at once; files are uploaded from disk
+        async def post_one(client):
+            if method in EXTRACTORS:
+                with open(path, "rb") as upload_file:
+                    response = await client.post("/flashcard/", data=form, files={"file": (name, upload_file)}, timeout=None)
+            else:
+                response = await client.post("/flashcard/", data={**form, "text": data.decode("utf-8")}, timeout=None)
+            result = response.json()
+            if response.status_code != 200:
+                raise RuntimeError(f"/flashcard/ returned {response.status_code}: {result}")
+            return {
+                "chunks": result["chunks"]["total"], "flashcards": len(result["flashcards"]),
+                "failed_chunks": len(result["failed_chunks"]), "filtered_tokens": result["filtered"]["tokens"],
+            }
+
+        async def post(uploads: int = 1):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                results = await asyncio.gather(*(post_one(client) for _ in range(uploads)))
+            return results[0]
+        stats = measure(lambda: client_loop.run_until_complete(post()), args.memory)
+        stats["chunks_per_second"] = rate(stats["chunks"], stats["seconds"])
+        stats["pages_per_second"] = rate(pages, stats["seconds"])
+        if args.rss:
+            with ResidentPeak() as resident:
+                client_loop.run_until_complete(post(args.uploads))
+            stats.update(resident.stats())
+        stages["generate"] = stats
+
+    if "stream" in args.stages:
+        async def stream():
+            plan = main.make_plan(args.type, args.concurrency, args.pack_tokens)
+            started = time.perf_counter()
+            first_card = None
+            chunks = 0
+            filtered_tokens = 0
+            content_filter = main.make_content_filter(method)
+            upload = Upload.from_file(path) if method in EXTRACTORS else Upload.from_bytes(data)
+            chunk_stream = main.extract_chunks(method, upload, plan, content_filter)
+            async for event in main.stream_flashcards(chunk_stream, plan, "benchmark", content_filter):
+                if event["event"] == "chunk":
+                    chunks += 1
+                    if first_card is None and event["flashcards"]:
+                        first_card = time.perf_counter() - started
+                elif event["event"] == "done":
+                    filtered_tokens = event["filtered"]["tokens"]
+            return {
+                "chunks": chunks, "first_card_seconds": round(first_card, 4) if first_card is not None else None,
+                "filtered_tokens": filtered_tokens,
+            }
+        stats = measure(lambda: client_loop.run_until_complete(stream()), args.memory)
+        stats["chunks_per_second"] = rate(stats["chunks"], stats["seconds"])
+        stages["stream"] = stats
+
+    return {"document": name, "method": method, "pages": pages, "bytes": len(data), "stages": stages}
+
+# Import the app in fresh interpreters, as a cold start would, then warm it up. Keeps the fastest of
+# `runs` runs, since import time is noisy.
+STARTUP_SCRIPT = """
+import json, time
+import main
+started = time.perf_counter()
+main.warm_up()
+warm_up_seconds = time.perf_counter() - started
+main.extraction_pool.shutdown()
+print(json.dumps({"import_seconds": main.IMPORT_SECONDS, "warm_up_seconds": warm_up_seconds}))
+"""
+
+def measure_startup(runs: int = 3) -> dict:
+    best = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            best[name] = round(min(seconds, best.get(name, seconds)), 4)
+    return best
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_results(results: list):
+    print(f"{'document':34} {'stage':9} {'seconds':>9} {'pages/s':>9} {'chunks/s':>9} {'1st card':>9} {'peak MB':>8} {'+RSS MB':>8}")
+    for result in results:
+        for stage, stats in result["stages"].items():
+            print(f"{result['document'][:34]:34} {stage:9} {stats['seconds']:>9.3f} "
+                  f"{stats.get('pages_per_second') or '':>9} {stats.get('chunks_per_second') or '':>9} "
+                  f"{stats.get('first_card_seconds') or '':>9} {stats.get('peak_mb', ''):>8} {stats.get('rss_growth_mb', ''):>8}")
+
+# Fail the run when a request grew resident memory past the limit, so the check can gate CI
+def check_rss_growth(results: list, limit_mb: float):
+    over = [
+        (result["document"], result["stages"]["generate"]["rss_growth_mb"]) for result in results
+        if result["stages"].get("generate", {}).get("rss_growth_mb", 0) > limit_mb
+    ]
+    for document, growth in over:
+        print(f"{document}: a request added {growth} MB of resident memory, more than {limit_mb} MB", file=sys.stderr)
+    if over:
+        sys.exit(1)
+
+# Fail the run when splitting text a piece at a time gave other chunks than splitting it whole
+def check_incremental_split(results: list):
+    mismatched = [
+        (result["document"], result["stages"]["split"]["incremental_mismatches"]) for result in results
+        if result["stages"].get("split", {}).get("incremental_mismatches")
+    ]
+    for document, piece_sizes in mismatched:
+        print(f"{document}: splitting in pieces of {piece_sizes} characters differs from splitting the whole text", file=sys.stderr)
+    if mismatched:
+        sys.exit(1)
+
+# Print the change in wall time for every (document, stage) present in both runs, and in startup time
+def compare(previous_path: str, results: list, startup: dict):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+    before = {(result["document"], stage): stats["seconds"] for result in previous["results"] for stage, stats in result["stages"].items()}
+    print(f"\nCompared with {previous['meta']['commit']} ({previous_path}):")
+    for result in results:
+        for stage, stats in result["stages"].items():
+            old = before.get((result["document"], stage))
+            if old:
+                change = (stats["seconds"] - old) / old * 100
+                print(f"{result['document'][:34]:34} {stage:9} {old:>9.3f} -> {stats['seconds']:>9.3f} ({change:+.1f}%)")
+    for name, seconds in startup.items():
+        old = previous["meta"].get("startup", {}).get(name)
+        if old:
+            print(f"{'startup':34} {name:19} {old:>9.3f} -> {seconds:>9.3f} ({(seconds - old) / old * 100:+.1f}%)")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100", help="Synthetic document sizes in pages, comma-separated (default 10,100)")
+    parser.add_argument("--methods", default="pdf,docx,pptx,csv,text", help="Input methods to benchmark (default all)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Stages to run (default {','.join(STAGES)})")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latency of each fake LLM call (default 50)")
+    parser.add_argument("--type", default="type-I", choices=sorted(main.FLASHCARD_TYPES), help="Flashcard type (default type-I)")
+    parser.add_argument("--concurrency", type=int, help="Per-request LLM concurrency (default: the server's)")
+    parser.add_argument("--pack-tokens", type=int, help="Pack chunks into calls of up to this many tokens (default: the server's)")
+    parser.add_argument("--no-study", action="store_true", help="Skip the documents in study/")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the peak-memory pass")
+    parser.add_argument("--no-rss", dest="rss", action="store_false", help="Skip measuring the resident memory of requests")
+    parser.add_argument("--uploads", type=int, default=1, help="Identical /flashcard/ requests sent at once when measuring resident memory (default 1)")
+    parser.add_argument("--max-rss-growth-mb", type=float,
+                        help="Exit with status 1 if any measured request adds more than this much resident memory")
+    parser.add_argument("--no-startup", dest="startup", action="store_false", help="Skip measuring cold-start time")
+    parser.add_argument("--output", help="Where to save the JSON results (default .flashygen/benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier JSON results to compare wall times against")
+    args = parser.parse_args()
+    args.stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    fake_llm = FakeChatModel(args.latency_ms / 1000)
+    for model in main.MODEL_TIERS:
+        main.llms[model] = fake_llm
+    # Stages are measured warm; cold-start cost is measured separately
+    main.warm_up()
+
+    documents = load_documents([int(size) for size in args.sizes.split(",") if size], args.methods.split(","), not args.no_study)
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for name, method, size, data in documents:
+            print(f"Benchmarking {name} ({len(data) / 2 ** 20:.2f} MB)...", file=sys.stderr)
+            results.append(benchmark_document(name, method, data, args, loop))
+    finally:
+        if main.extraction_pool is not None:
+            main.extraction_pool.shutdown()
+        loop.close()
+
+    startup = measure_startup() if args.startup else {}
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency_ms": args.latency_ms,
+            "type": args.type,
+            "concurrency": args.concurrency or main.DEFAULT_REQUEST_CONCURRENCY,
+            "pack_tokens": args.pack_tokens if args.pack_tokens is not None else main.PACK_TOKEN_BUDGET,
+            "extraction_workers": main.EXTRACTION_WORKERS,
+            "fake_llm_calls": sum(llm.calls for llm in fake_llm.structured.values()),
+            "uploads": args.uploads,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "startup": startup,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(".flashygen", f"benchmark-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print_results(results)
+    if startup:
+        print(f"\nStartup: import {startup['import_seconds']:.3f}s, warm-up {startup['warm_up_seconds']:.3f}s")
+    print(f"\nSaved to {output}")
+    if args.compare:
+        compare(args.compare, results, startup)
+    if args.max_rss_growth_mb is not None:
+        check_rss_growth(results, args.max_rss_growth_mb)
+    check_incremental_split(results)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,82 @@
+import re
+from collections import Counter, deque
+from chunking import count_tokens
+from salience import content_terms
+
+# Lines longer than this are body text, never boilerplate
+MAX_BOILERPLATE_CHARS = 150
+
+# Lines that carry no content wherever they appear: page numbers ("12", "- 12 -", "Page 3 of 40",
+# "3/40") and table-of-contents entries with dot leaders ("Introduction ........ 3")
+_PAGE_NUMBER = re.compile(r"^[\W_]*(page\s*)?\d+(\s*(of|/)\s*\d+)?[\W_]*$", re.IGNORECASE)
+_TOC_ENTRY = re.compile(r"(\.\s*){4,}\d+\s*$|…+\s*\d+\s*$")
+_DIGITS = re.compile(r"\d+")
+
+# Lines compare equal up to case, spacing and numbers, so the footers "Page 3" and "Page 4" match
+def line_key(line: str) -> str:
+    return _DIGITS.sub("#", " ".join(line.lower().split()))
+
+def low_information_line(line: str) -> bool:
+    line = line.strip()
+    return bool(_PAGE_NUMBER.match(line) or _TOC_ENTRY.search(line))
+
+
+class BoilerplateFilter:
+    """Drops noise from one document before generation and counts the tokens it saves.
+
+    Units (PDF pages, slides or DOCX sections, see extractors.py) lose the lines that appear on at
+    least min_pages of them, such as running headers, footers and copyright lines, along with page
+    numbers and table-of-contents entries. Lines are counted over the units seen so far and the next
+    `lookahead` units, so units stream through without waiting for the whole document. After
+    splitting, chunks with fewer than min_words content words are dropped.
+    """
+
+    def __init__(self, min_pages: int = 3, min_words: int = 4, lookahead: int = 4):
+        self.min_pages = min_pages
+        self.min_words = min_words
+        self.lookahead = lookahead
+        # Line key -> number of units it appears on
+        self.line_pages = Counter()
+        self.lines = 0
+        self.chunks = 0
+        self.tokens = 0
+
+    def repeated(self, line: str) -> bool:
+        return bool(self.min_pages) and len(line) <= MAX_BOILERPLATE_CHARS and self.line_pages[line_key(line)] >= self.min_pages
+
+    def clean(self, lines: list) -> str:
+        kept = []
+        dropped = []
+        for line in lines:
+            if line.strip() and (low_information_line(line) or self.repeated(line)):
+                dropped.append(line)
+            else:
+                kept.append(line)
+        if dropped:
+            self.lines += len(dropped)
+            self.tokens += count_tokens("\n".join(dropped))
+        return "\n".join(kept) + "\n" if kept else ""
+
+    async def filter_units(self, units):
+        window = deque()
+        async for unit in units:
+            lines = unit["text"].splitlines()
+            self.line_pages.update({line_key(line) for line in lines if line.strip() and len(line) <= MAX_BOILERPLATE_CHARS})
+            window.append((unit, lines))
+            if len(window) > self.lookahead:
+                unit, lines = window.popleft()
+                yield {**unit, "text": self.clean(lines)}
+        while window:
+            unit, lines = window.popleft()
+            yield {**unit, "text": self.clean(lines)}
+
+    async def filter_chunks(self, chunks):
+        async for chunk in chunks:
+            if chunk.strip() and len(content_terms(chunk)) < self.min_words:
+                self.chunks += 1
+                self.tokens += count_tokens(chunk)
+                continue
+            yield chunk
+
+    def summary(self) -> dict:
+        return {"lines": self.lines, "chunks": self.chunks, "tokens": self.tokens}
@@ -0,0 +1,259 @@
+"""Offline bulk generation: flashcard decks for every document in a directory or glob.
+
+Documents are extracted in the server's worker pool and all of their chunks share one queue of
+LLM calls, paced by the same rate-limit scheduler as the server (set LLM_REQUESTS_PER_MINUTE and
+LLM_TOKENS_PER_MINUTE to your Groq quota to saturate it). Formats are detected from the extension
+or, failing that, the file's content.
+
+    python bulk.py study/ --type type-I --output decks.jsonl
+    python bulk.py "catalog/**/*.pdf" --type type-II --output decks.csv --concurrency 32
+
+Each finished document is recorded in <output>.checkpoint, so an interrupted run picks up where it
+stopped when the same command is run again; pass --restart to start over.
+"""
+import argparse
+import asyncio
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from typing import Optional
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+import main
+from extractors import detect_method
+from uploads import Upload
+
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+# Files matched by the inputs: directories are searched recursively, anything else is a glob pattern
+def find_files(inputs: list) -> list:
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                paths.extend(os.path.join(root, name) for name in names if not name.startswith("."))
+        else:
+            paths.extend(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(set(paths))
+
+# A file is done when the checkpoint has it at the same size and modification time
+def file_key(path: str) -> list:
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+def load_checkpoint(path: str) -> set:
+    done = set()
+    if os.path.exists(path):
+        with open(path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    done.add(tuple(json.loads(line)))
+                except ValueError:
+                    # The last line may be cut short by an interruption
+                    continue
+    return done
+
+
+class DeckWriter:
+    """Appends finished decks to a JSONL file (one document per line) or a CSV file (one card per row)."""
+
+    def __init__(self, path: str, output_format: str, card_fields: list):
+        self.format = output_format
+        self.card_fields = card_fields
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="" if output_format == "csv" else None, encoding="utf-8")
+        if output_format == "csv":
+            self.writer = csv.writer(self.file)
+            if new:
+                self.writer.writerow(["document", "method", *card_fields])
+
+    def write(self, document: dict):
+        if self.format == "jsonl":
+            self.file.write(json.dumps(document) + "\n")
+        else:
+            for card in document["flashcards"]:
+                self.writer.writerow([document["name"], document["method"], *(
+                    " | ".join(card.get(field) or []) if isinstance(card.get(field), list) else card.get(field, "")
+                    for field in self.card_fields
+                )])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Progress:
+    """Running totals of a bulk run, for the periodic status line and the final report."""
+
+    def __init__(self, documents: int):
+        self.documents = documents
+        self.started = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+        self.incomplete = 0
+        self.skipped = 0
+        self.cached = 0
+        self.chunks = 0
+        self.flashcards = 0
+
+    def add(self, document: Optional[dict]):
+        if document is None:
+            self.skipped += 1
+            return
+        if "error" in document:
+            self.failed += 1
+            return
+        if document["failed_chunks"]:
+            self.incomplete += 1
+        else:
+            self.done += 1
+        self.cached += document.get("cached", False)
+        self.chunks += document["chunks"]["total"]
+        self.flashcards += len(document["flashcards"])
+
+    def tokens(self) -> float:
+        return sum(
+            REGISTRY.get_sample_value(name, {"model": model}) or 0
+            for name in ("flashygen_prompt_tokens_total", "flashygen_completion_tokens_total")
+            for model in main.MODEL_TIERS
+        )
+
+    def line(self) -> str:
+        minutes = (time.perf_counter() - self.started) / 60
+        finished = self.done + self.incomplete + self.failed + self.skipped
+        return (
+            f"{finished}/{self.documents} documents, {self.chunks} chunks, {self.flashcards} cards | "
+            f"{finished / minutes if minutes else 0:.1f} docs/min, {self.chunks / minutes / 60 if minutes else 0:.1f} chunks/s, "
+            f"{self.tokens() / minutes if minutes else 0:.0f} tokens/min"
+        )
+
+    def report(self) -> str:
+        seconds = time.perf_counter() - self.started
+        scheduler = main.llm_scheduler.stats()
+        lines = [
+            f"Finished in {seconds:.1f}s: {self.line()}",
+            f"  complete {self.done} (from cache {self.cached}), incomplete {self.incomplete}, failed {self.failed}, "
+            f"skipped {self.skipped} (unsupported format)",
+        ]
+        for model, stats in scheduler.items():
+            lines.append(
+                f"  {model}: {stats['calls']} calls, {stats['retries']} retries, {stats['rate_limited']} rate limited, "
+                f"{stats['failed']} failed, {stats['waited_seconds']:.1f}s waiting for rate limits"
+            )
+        return "\n".join(lines)
+
+async def report_progress(progress: Progress, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(progress.line(), file=sys.stderr)
+
+# Generate decks for the pending files, at most `documents` at a time, writing each deck and its
+# checkpoint entry as soon as it is finished. Files are extracted in place, never read into memory whole.
+async def run(paths: list, plan: main.GenerationPlan, args, writer: DeckWriter, checkpoint, progress: Progress):
+    request_semaphore = asyncio.Semaphore(plan.concurrency)
+    extraction_slots = asyncio.Semaphore(main.EXTRACTION_WORKERS)
+    document_slots = asyncio.Semaphore(args.documents)
+
+    async def generate(path: str):
+        async with document_slots:
+            key = file_key(path)
+            upload = await asyncio.to_thread(Upload.from_file, path)
+            with upload.open() as document_file:
+                method = detect_method(path, document_file)
+            if method is None:
+                progress.add(None)
+                print(f"{path}: skipped, unsupported format", file=sys.stderr)
+                return
+            document = await main.generate_document(path, method, upload, plan, request_semaphore, extraction_slots)
+        progress.add(document)
+        if "error" in document:
+            print(f"{path}: {document['error']}", file=sys.stderr)
+            return
+        if document["failed_chunks"]:
+            # Left out of the output and the checkpoint so the next run retries it; chunks that
+            # succeeded come from the chunk cache
+            print(f"{path}: {len(document['failed_chunks'])} chunks failed, will retry on the next run", file=sys.stderr)
+            return
+        writer.write(document)
+        checkpoint.write(json.dumps(key) + "\n")
+        checkpoint.flush()
+
+    reporter = asyncio.create_task(report_progress(progress, args.progress_interval))
+    try:
+        await asyncio.gather(*(generate(path) for path in paths))
+    finally:
+        reporter.cancel()
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Directories (searched recursively) or glob patterns")
+    parser.add_argument("--output", required=True, help="Output file, .jsonl or .csv")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="Output format (default: from the output's extension)")
+    parser.add_argument("--type", default="type-I", choices=sorted(main.FLASHCARD_TYPES), help="Flashcard type (default type-I)")
+    parser.add_argument("--concurrency", type=int, help="LLM calls in flight (default MAX_CONCURRENT_LLM_CALLS)")
+    parser.add_argument("--documents", type=int, default=16, help="Documents in progress at once (default 16)")
+    parser.add_argument("--pack-tokens", type=int, help="Pack chunks into calls of up to this many tokens")
+    parser.add_argument("--chunk-tokens", type=int, help="Chunk size in tokens")
+    parser.add_argument("--overlap-tokens", type=int, help="Chunk overlap in tokens")
+    parser.add_argument("--dedup-threshold", type=float, help="Near-duplicate threshold, 0 to disable")
+    parser.add_argument("--max-cards", type=int, help="Cards per document, from its most informative chunks")
+    parser.add_argument("--token-budget", type=int, help="Chunk tokens sent per document, to its most informative chunks")
+    parser.add_argument("--sample-rows", type=int, help="Rows read from each CSV or XLSX sheet, spread over the sheet")
+    parser.add_argument("--progress-interval", type=float, default=10, help="Seconds between status lines (default 10)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if output_format not in OUTPUT_FORMATS:
+        parser.error("--output must end in .jsonl or .csv, or pass --format")
+    if args.documents < 1:
+        parser.error("--documents must be at least 1")
+
+    try:
+        plan = main.make_plan(
+            args.type, args.concurrency or main.MAX_CONCURRENT_LLM_CALLS, args.pack_tokens,
+            args.chunk_tokens, args.overlap_tokens, args.dedup_threshold, args.max_cards, args.token_budget,
+            args.sample_rows,
+        )
+    except HTTPException as e:
+        parser.error(e.detail)
+
+    checkpoint_path = args.output + ".checkpoint"
+    if args.restart:
+        for path in (args.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+    done = load_checkpoint(checkpoint_path)
+    paths = find_files(args.inputs)
+    pending = [path for path in paths if tuple(file_key(path)) not in done]
+    print(f"{len(paths)} files found, {len(paths) - len(pending)} already done, {len(pending)} to generate", file=sys.stderr)
+    if not pending:
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    card_fields = list(plan.card_fields) + (["importance"] if main.budgeted(plan) else [])
+    writer = DeckWriter(args.output, output_format, card_fields)
+    progress = Progress(len(pending))
+    interrupted = False
+    try:
+        with open(checkpoint_path, "a") as checkpoint:
+            asyncio.run(run(pending, plan, args, writer, checkpoint, progress))
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; run the same command again to resume.", file=sys.stderr)
+    finally:
+        writer.close()
+        if main.extraction_pool is not None:
+            main.extraction_pool.shutdown(cancel_futures=True)
+    print(progress.report(), file=sys.stderr)
+    if interrupted:
+        sys.exit(130)
+    if progress.failed or progress.incomplete:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,172 @@
+import re
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Default chunk size and overlap, in tokens. 200 tokens is roughly the old 750-character chunk;
+# a 20-token overlap re-sends 10% of the input instead of ~13%.
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 20
+
+# Split on paragraphs first, then lines and sentences, then words; characters only as a last resort
+SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", "; ", " ", ""]
+
+# tiktoken is optional, and loading an encoding may need to download it, so fall back to an estimate
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Count tokens with a BPE encoding when available. Otherwise estimate one token per punctuation mark
+# and per word, plus one for every eight characters of a long word (BPE splits those into pieces).
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(1 + len(word) // 8 for word in _WORD_PATTERN.findall(text))
+
+# Splitter measuring chunk size and overlap in tokens and preferring paragraph and sentence boundaries
+def make_splitter(chunk_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=count_tokens,
+        separators=SEPARATORS,
+        keep_separator="end",
+    )
+
+
+class IncrementalSplitter:
+    """Splits text that arrives in pieces into the same chunks as splitting it whole, releasing chunks
+    while later text is still being read.
+
+    Text is buffered until `window` more characters arrive, then split up to the last occurrence of its
+    coarsest separator. All chunks but the last are released and the buffer restarts at the unit
+    (paragraph, line, sentence) where the last chunk begins, so splitting resumes with the same merge
+    state as a whole-text split would have there. A unit too large to be merged with its neighbours is
+    split on its own, so once it is complete its chunks are final and the buffer restarts after it.
+    A unit longer than the window is split a window at a time at the next separator down; when it ends,
+    the rest of it is split on its own.
+    """
+
+    def __init__(self, chunk_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+        self.splitter = make_splitter(chunk_tokens, overlap_tokens)
+        self.chunk_tokens = chunk_tokens
+        # About eight chunks at a generous estimate of four characters per token. A unit that fills the
+        # window is then certain to be too large to merge with its neighbours.
+        self.window = chunk_tokens * 4 * 8
+        self.buffer = ""
+        self.carried = 0
+        # Index in SEPARATORS of the coarsest separator seen so far, and of the separators of the units
+        # longer than the window that the buffer starts inside of, outermost first
+        self.outer = None
+        self.open = []
+
+    # Add a piece of text and return the chunks that are final
+    def feed(self, piece: str) -> list:
+        self.buffer += piece
+        if len(self.buffer) < self.carried + self.window:
+            return []
+        chunks = self.split_ready()
+        self.carried = len(self.buffer)
+        return chunks
+
+    # Return the remaining chunks once all text has been fed
+    def finish(self) -> list:
+        self.note_level(self.level())
+        chunks = self.close_units() + self.splitter.split_text(self.buffer)
+        self.buffer = ""
+        return chunks
+
+    # Index in SEPARATORS of the coarsest separator in the buffer
+    def level(self):
+        return next((number for number, separator in enumerate(SEPARATORS) if separator and separator in self.buffer), None)
+
+    def note_level(self, level):
+        if level is None:
+            return
+        if self.outer is None:
+            self.outer = level
+        elif level < self.outer:
+            # A coarser separator appears for the first time: all text so far was one unit of it
+            self.open = sorted(set(self.open) | set(range(level, self.outer)))
+            self.outer = level
+
+    # Split off the rest of each long unit that ends in the buffer, innermost first. A unit also ends
+    # where one enclosing it does.
+    def close_units(self) -> list:
+        ends = [
+            (number, self.buffer.find(SEPARATORS[number]) + len(SEPARATORS[number]))
+            for number in self.open if SEPARATORS[number] in self.buffer
+        ]
+        chunks = []
+        cut = 0
+        while self.open:
+            end = min((end for number, end in ends if number <= self.open[-1]), default=None)
+            if end is None:
+                break
+            end = max(end, cut)
+            chunks += self.splitter.split_text(self.buffer[cut:end])
+            cut = end
+            self.open.pop()
+        self.buffer = self.buffer[cut:]
+        return chunks
+
+    def split_ready(self) -> list:
+        level = self.level()
+        if level is None:
+            return []
+        self.note_level(level)
+        chunks = []
+        if self.open:
+            closed = len(self.open)
+            chunks = self.close_units()
+            closed -= len(self.open)
+            level = self.level()
+            if level is None:
+                return chunks
+        else:
+            closed = 0
+        inner = self.open[-1] + 1 if self.open else self.outer
+        if level > inner:
+            if closed:
+                # The next unit has just begun; wait to see how long it is
+                return chunks
+            # The buffer lies within one long unit of each coarser separator
+            self.open += range(inner, level)
+        separator = SEPARATORS[level]
+        end = self.buffer.rfind(separator) + len(separator)
+        ready = self.splitter.split_text(self.buffer[:end])
+        if not ready:
+            self.buffer = self.buffer[end:]
+            return chunks
+        last = len(self.buffer[:end].rstrip()) - len(ready[-1])
+        start = self.buffer.rfind(separator, 0, last)
+        start = start + len(separator) if start >= 0 else 0
+        unit_end = self.buffer.find(separator, start) + len(separator)
+        if count_tokens(self.buffer[start:unit_end]) >= self.chunk_tokens:
+            # The last chunk is part of a unit split on its own, which no later text can change
+            self.buffer = self.buffer[end:]
+            return chunks + ready
+        self.buffer = self.buffer[start:]
+        return chunks + ready[:-1]
+
+
+class LocatedChunk(str):
+    """Chunk text that remembers where in the source it came from, such as a time span of a video.
+
+    The location is copied onto every flashcard generated from the chunk as its `source`.
+    """
+
+    def __new__(cls, text: str, location: dict):
+        chunk = super().__new__(cls, text)
+        chunk.location = location
+        return chunk
+
+# Location of a chunk packed from several units, such as {"pages": [3, 4]}: each key's values in order, without repeats
+def merge_locations(locations: list) -> dict:
+    merged = {}
+    for location in locations:
+        for key, values in location.items():
+            merged.setdefault(key, []).extend(value for value in values if value not in merged[key])
+    return merged
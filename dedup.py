@@ -0,0 +1,119 @@
+import re
+import numpy as np
+
+# MinHash signatures of NUM_PERMUTATIONS values, bucketed by locality-sensitive hashing in bands of rows
+# values each. Two cards share a bucket with probability 1 - (1 - s^rows)^bands at similarity s, so the
+# rows per band are chosen for each threshold: as many as keep that probability at least LSH_RECALL for
+# cards exactly at the threshold. Fewer rows mean more buckets shared, and more cards compared.
+NUM_PERMUTATIONS = 64
+LSH_RECALL = 0.98
+SHINGLE_SIZE = 4
+
+# Multiply-shift hash functions standing in for random permutations; seeded so signatures are stable
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+
+# Fields holding a card's content, for both flashcard types; metadata such as source locations is ignored
+CONTENT_FIELDS = ("question", "answer", "question_with_blanks", "correct_answers")
+
+def card_text(card: dict) -> str:
+    parts = []
+    for field in CONTENT_FIELDS:
+        value = card.get(field)
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        elif value is not None:
+            parts.append(str(value))
+    return " ".join(parts)
+
+# Distinct 4-byte shingles of the lowercased words, each packed into one integer, so punctuation and
+# spacing differences don't matter
+def shingle_hashes(text: str) -> np.ndarray:
+    normalized = " ".join(re.findall(r"\w+", text.lower())).encode("utf-8")
+    data = np.frombuffer(normalized.ljust(SHINGLE_SIZE), dtype=np.uint8).astype(np.uint64)
+    windows = len(data) - SHINGLE_SIZE + 1
+    packed = np.zeros(windows, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        packed = (packed << np.uint64(8)) | data[offset:offset + windows]
+    return np.unique(packed)
+
+# Rows per band for a threshold: the most, among the divisors of NUM_PERMUTATIONS, that still put cards
+# at the threshold in a shared bucket with probability LSH_RECALL: 4 rows (16 bands) from about 0.68,
+# which includes the default 0.7, 2 rows from about 0.34 and 1 row below that.
+def band_rows(threshold: float) -> int:
+    rows = 1
+    for candidate in (2, 4, 8, 16, 32, 64):
+        if 1 - (1 - threshold ** candidate) ** (NUM_PERMUTATIONS // candidate) >= LSH_RECALL:
+            rows = candidate
+    return rows
+
+# Collapse each band of `rows` signature values into one integer bucket key
+_BAND_MIX = _rng.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+
+def band_keys(signatures: np.ndarray, rows: int) -> np.ndarray:
+    return (signatures.reshape(len(signatures), -1, rows) * _BAND_MIX[:rows]).sum(axis=2, dtype=np.uint64)
+
+# MinHash signatures for many cards at once, one row per card: all shingles are hashed in a single
+# pass and reduced per card
+def minhash_many(cards: list) -> np.ndarray:
+    shingles = [shingle_hashes(card_text(card)) for card in cards]
+    if not shingles:
+        return np.empty((0, NUM_PERMUTATIONS), dtype=np.uint64)
+    offsets = np.cumsum([0] + [len(card_shingles) for card_shingles in shingles[:-1]])
+    hashed = (np.outer(_A, np.concatenate(shingles)) + _B[:, None]) >> _SHIFT
+    return np.minimum.reduceat(hashed, offsets, axis=1).T
+
+
+class Deduplicator:
+    """Online near-duplicate filter: a card is dropped when it is similar to a card already kept.
+
+    Each card is compared only with the kept cards sharing one of its LSH buckets, so filtering
+    n cards takes roughly linear time.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.rows = band_rows(threshold)
+        # Signatures of kept cards, one row each; the array doubles in size as it fills
+        self.signatures = np.empty((64, NUM_PERMUTATIONS), dtype=np.uint64)
+        self.kept = 0
+        self.buckets = [{} for _ in range(NUM_PERMUTATIONS // self.rows)]
+        self.dropped = 0
+
+    def add(self, card: dict) -> bool:
+        signatures = minhash_many([card])
+        return self._add(signatures[0], band_keys(signatures, self.rows)[0].tolist())
+
+    # Keep the cards that are not near-duplicates of earlier ones, preserving order
+    def filter(self, cards: list) -> list:
+        kept = []
+        # Hash in slices to bound the size of the intermediate hash matrix
+        for start in range(0, len(cards), 512):
+            batch = cards[start:start + 512]
+            signatures = minhash_many(batch)
+            for card, signature, keys in zip(batch, signatures, band_keys(signatures, self.rows).tolist()):
+                if self._add(signature, keys):
+                    kept.append(card)
+        return kept
+
+    def _add(self, signature: np.ndarray, keys: list) -> bool:
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        if candidates:
+            # The fraction of matching signature values estimates the Jaccard similarity of the shingle sets
+            matches = np.count_nonzero(self.signatures[list(candidates)] == signature, axis=1)
+            if matches.max() >= self.threshold * NUM_PERMUTATIONS:
+                self.dropped += 1
+                return False
+
+        index = self.kept
+        if index == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.empty_like(self.signatures)])
+        self.signatures[index] = signature
+        self.kept += 1
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(index)
+        return True
@@ -1,10 +1,13 @@
 import os
+import sys
 import PyPDF2
 from langchain_groq import ChatGroq
 from langchain.prompts import ChatPromptTemplate
 from typing_extensions import Annotated, TypedDict, List
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Shared token-based chunker from the repository root
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+from chunking import make_splitter
 from youtube_transcript_api import YouTubeTranscriptApi
 # Load environment variables
 load_dotenv()
@@ -55,7 +58,7 @@ link_path = "https://www.youtube.com/watch?v=okolv1y6IlE"  # organic chemistry s
 video_text = extract_text_from_yt(link_path)
 
 # Split the document into manageable chunks
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=750, chunk_overlap=100)
+text_splitter = make_splitter()
 chunks = text_splitter.split_text(video_text)
 
 # Initialize a list to store all flashcards
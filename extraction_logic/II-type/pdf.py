@@ -1,10 +1,13 @@
 import os
+import sys
 import PyPDF2
 from langchain_groq import ChatGroq
 from langchain.prompts import ChatPromptTemplate
 from typing_extensions import Annotated, TypedDict, List
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Shared token-based chunker from the repository root
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+from chunking import make_splitter
 
 # Load environment variables
 load_dotenv()
@@ -49,7 +52,7 @@ pdf_path = "study\dataanalytics.pdf"  # Adjust the path to your document
 pdf_text = extract_text_from_pdf(pdf_path)
 
 # Split the document into manageable chunks
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=750, chunk_overlap=100)
+text_splitter = make_splitter()
 chunks = text_splitter.split_text(pdf_text)
 
 # Initialize a list to store cloze deletion flashcards
@@ -0,0 +1,250 @@
+import csv   # For CSV extraction
+import importlib
+import io
+import os
+import threading
+import zipfile
+from typing import List, Optional
+from uploads import map_file, open_mapped
+
+# File-based extraction methods, keyed by the `method` form field. Parser libraries (PyPDF2,
+# python-pptx, python-docx) take a while to import, so each extractor imports its own on first
+# use and PARSER_MODULES records which one, for preloading.
+EXTRACTORS = {}
+PARSER_MODULES = {}
+
+# Register an extraction function for a method; parser_module is the library it imports
+def register_extractor(method: str, parser_module: Optional[str] = None):
+    def register(function):
+        EXTRACTORS[method] = function
+        if parser_module:
+            PARSER_MODULES[method] = parser_module
+        return function
+    return register
+
+# Import the parser libraries of the given methods (default all) ahead of the first request
+def preload_extractors(methods: Optional[list] = None):
+    for method in methods or PARSER_MODULES:
+        if method in PARSER_MODULES:
+            importlib.import_module(PARSER_MODULES[method])
+
+# Yield the text of each page lazily, so callers can start on early pages before the whole file is parsed
+def iter_pdf_pages(file, start: int = 0, stop: Optional[int] = None):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file)
+    for page in reader.pages[start:stop]:
+        yield page.extract_text() or ""
+
+# Text extraction functions
+@register_extractor("pdf", "PyPDF2")
+def extract_text_from_pdf(file) -> str:
+    return "".join(iter_pdf_pages(file))
+
+# Structured extraction: PPTX and DOCX files come out as a list of units, whole slides or sections
+# under a heading, each a dict with its "text" and its "location" in the document (such as
+# {"slides": [3]}), so chunks can be packed along the document's own boundaries.
+
+def table_text(table) -> str:
+    return "".join(" | ".join(" ".join(cell.text.split()) for cell in row.cells) + "\n" for row in table.rows)
+
+# Text of a slide's shapes in order, looking inside groups and tables
+def shape_text(shapes, skip=None) -> str:
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+    text = ""
+    for shape in shapes:
+        if skip is not None and shape.shape_id == skip.shape_id:
+            continue
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            text += shape_text(shape.shapes)
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            text += table_text(shape.table)
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame and shape.text_frame.text.strip():
+            text += shape.text_frame.text + "\n"
+    return text
+
+# One unit per slide: the title, then the other shapes (grouped shapes and tables included), then the speaker notes
+def iter_pptx_slides(file):
+    import pptx
+    presentation = pptx.Presentation(file)
+    for number, slide in enumerate(presentation.slides, 1):
+        title = slide.shapes.title
+        text = title.text_frame.text + "\n" if title is not None and title.text_frame.text.strip() else ""
+        text += shape_text(slide.shapes, skip=title)
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+            notes = slide.notes_slide.notes_text_frame.text.strip()
+            if notes:
+                text += "Speaker notes: " + notes + "\n"
+        yield {"text": text, "location": {"slides": [number]}}
+
+@register_extractor("pptx", "pptx")
+def extract_text_from_pptx(file) -> str:
+    return "".join(unit["text"] for unit in iter_pptx_slides(file))
+
+# One unit per heading section: a heading paragraph and the paragraphs and tables up to the next
+# heading, in document order. Text before the first heading is a section of its own.
+def iter_docx_sections(file):
+    import docx
+    from docx.table import Table
+    doc = docx.Document(file)
+    heading = None
+    text = ""
+    for block in doc.iter_inner_content():
+        if isinstance(block, Table):
+            text += table_text(block)
+            continue
+        style = block.style.name if block.style is not None else ""
+        if (style.startswith("Heading") or style == "Title") and block.text.strip():
+            if text.strip():
+                yield {"text": text, "location": {"sections": [heading]} if heading else {}}
+            heading = " ".join(block.text.split())
+            text = ""
+        text += block.text + "\n"
+    if text.strip():
+        yield {"text": text, "location": {"sections": [heading]} if heading else {}}
+
+@register_extractor("docx", "docx")
+def extract_text_from_docx(file) -> str:
+    return "".join(unit["text"] for unit in iter_docx_sections(file))
+
+# Whole-text extraction of tables; generation reads them a group of rows at a time instead (see tables.py)
+@register_extractor("csv")
+def extract_text_from_csv(file) -> str:
+    decoded_file = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    text = "".join(" ".join(row) + "\n" for row in csv.reader(decoded_file))
+    decoded_file.detach()
+    file.seek(0)
+    return text
+
+@register_extractor("xlsx", "openpyxl")
+def extract_text_from_xlsx(file) -> str:
+    import openpyxl
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        text = "".join(" ".join("" if value is None else str(value) for value in row) + "\n" for row in rows)
+    finally:
+        workbook.close()
+    file.seek(0)
+    return text
+
+# Extensions read as plain text
+TEXT_EXTENSIONS = ("txt", "md")
+
+# Input method of a file: its extension when that names a known format, otherwise sniffed from the
+# content of the open binary file (PDF signature, Office zip layout, UTF-8 text). None when the format
+# isn't supported.
+def detect_method(filename: str, file) -> Optional[str]:
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    if extension in EXTRACTORS:
+        return extension
+    if extension in TEXT_EXTENSIONS:
+        return "text"
+    sample = file.read(65536)
+    if sample.startswith(b"%PDF-"):
+        return "pdf"
+    if sample.startswith(b"PK\x03\x04"):
+        try:
+            names = zipfile.ZipFile(file).namelist()
+        except zipfile.BadZipFile:
+            return None
+        if "ppt/presentation.xml" in names:
+            return "pptx"
+        if "word/document.xml" in names:
+            return "docx"
+        if "xl/workbook.xml" in names:
+            return "xlsx"
+        return None
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sample is still text
+        if e.start < len(sample) - 3 or not file.read(1):
+            return None
+    return "text"
+
+# Entry points for extraction workers take the path of the file on disk, so only the path crosses
+# the process boundary, and parse a read-only memory map of it instead of a copy in memory
+def extract_text(method: str, path: str) -> str:
+    with open_mapped(path) as file:
+        return EXTRACTORS[method](file)
+
+UNIT_EXTRACTORS = {"pptx": iter_pptx_slides, "docx": iter_docx_sections}
+
+# Entry point for extraction workers returning structured units; other formats are one unit without a location
+def extract_units(method: str, path: str) -> List[dict]:
+    if method in UNIT_EXTRACTORS:
+        with open_mapped(path) as file:
+            return list(UNIT_EXTRACTORS[method](file))
+    return [{"text": extract_text(method, path), "location": {}}]
+
+# Entry points for pipelined PDF ingestion: workers open the spooled file themselves
+# and extract one range of pages at a time, one unit per page
+def count_pdf_pages(path: str) -> int:
+    with _reader_lock:
+        count = len(open_pdf(path).pages)
+        keep_pdf_reader()
+    return count
+
+# last is set on the document's final batch, after which its reader is released at once
+def extract_pdf_pages(path: str, start: int, stop: int, last: bool = False) -> List[dict]:
+    with _reader_lock:
+        reader = open_pdf(path)
+        pages = [
+            {"text": page.extract_text() or "", "location": {"pages": [number]}}
+            for number, page in enumerate(reader.pages[start:stop], start + 1)
+        ]
+        if last:
+            release_pdf_reader()
+        else:
+            keep_pdf_reader()
+    return pages
+
+# Each worker keeps the last reader it opened, since consecutive page ranges of a document
+# usually land on the same worker and re-reading the page tree costs more than a small batch.
+# The reader parses a memory map of the file: given a path, PyPDF2 would read the whole file into memory.
+# The map keeps the spooled file's disk space even once the upload is deleted, so the reader is released
+# after the document's last batch, or, on workers that didn't run that batch, after PDF_READER_IDLE_SECONDS.
+PDF_READER_IDLE_SECONDS = 2.0
+_cached_reader = (None, None, None)
+_reader_lock = threading.Lock()
+_release_timer = None
+
+# Call with _reader_lock held
+def open_pdf(path: str) -> "PyPDF2.PdfReader":
+    global _cached_reader
+    import PyPDF2
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if _cached_reader[0] != key:
+        release_pdf_reader()
+        with open(path, "rb") as file:
+            mapping = map_file(file) if stat.st_size else None
+            _cached_reader = (key, PyPDF2.PdfReader(mapping if mapping is not None else file), mapping)
+    return _cached_reader[1]
+
+# Call with _reader_lock held
+def release_pdf_reader():
+    global _cached_reader
+    cancel_release()
+    mapping = _cached_reader[2]
+    _cached_reader = (None, None, None)
+    if mapping is not None:
+        mapping.close()
+
+# Call with _reader_lock held: release the reader unless another batch uses it within PDF_READER_IDLE_SECONDS
+def keep_pdf_reader():
+    global _release_timer
+    cancel_release()
+    _release_timer = threading.Timer(PDF_READER_IDLE_SECONDS, release_idle_reader)
+    _release_timer.daemon = True
+    _release_timer.start()
+
+def cancel_release():
+    global _release_timer
+    if _release_timer is not None:
+        _release_timer.cancel()
+        _release_timer = None
+
+def release_idle_reader():
+    with _reader_lock:
+        release_pdf_reader()
@@ -0,0 +1,136 @@
+"""Stand-in for the Groq chat completions API, for exercising FlashyGen without an API key.
+
+It answers tool calls with schema-valid arguments built from the prompt, after a configurable
+latency. It can inject 429s, randomly and whenever a requests-per-minute limit is exceeded, and
+unusable structured output from chosen models, to exercise escalation.
+
+    uvicorn fake_groq:app --port 8001
+    GROQ_API_BASE=http://localhost:8001 GROQ_API_KEY=fake uvicorn main:app
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Latency of every completion, plus up to FAKE_GROQ_JITTER_MS of random extra
+FAKE_GROQ_LATENCY_MS = float(os.getenv("FAKE_GROQ_LATENCY_MS", "200"))
+FAKE_GROQ_JITTER_MS = float(os.getenv("FAKE_GROQ_JITTER_MS", "100"))
+# Fraction of requests answered with a 429 regardless of load
+FAKE_GROQ_429_RATE = float(os.getenv("FAKE_GROQ_429_RATE", "0"))
+# Requests per minute, replenished continuously like Groq's limits; requests over it get a 429 (0 for no limit)
+FAKE_GROQ_RPM = int(os.getenv("FAKE_GROQ_RPM", "0"))
+FAKE_GROQ_RETRY_AFTER = float(os.getenv("FAKE_GROQ_RETRY_AFTER", "1"))
+# Fraction of tool calls from FAKE_GROQ_BAD_OUTPUT_MODELS (comma-separated, default all models) answered
+# with an empty list of cards or, as Groq does when a model botches a tool call, a 400 tool_use_failed error
+FAKE_GROQ_BAD_OUTPUT_RATE = float(os.getenv("FAKE_GROQ_BAD_OUTPUT_RATE", "0"))
+FAKE_GROQ_BAD_OUTPUT_MODELS = [model for model in os.getenv("FAKE_GROQ_BAD_OUTPUT_MODELS", "").split(",") if model]
+
+app = FastAPI()
+request_budget = {"level": float(FAKE_GROQ_RPM), "updated": time.monotonic()}
+counters = {"requests": 0, "completed": 0, "rate_limited": 0, "bad_output": 0}
+
+def rate_limited(message: str, retry_after: float) -> JSONResponse:
+    counters["rate_limited"] += 1
+    return JSONResponse(
+        status_code=429,
+        content={"error": {"message": message, "type": "tokens", "code": "rate_limit_exceeded"}},
+        headers={"retry-after": str(retry_after)},
+    )
+
+# Build a value matching a JSON schema, taking strings from the prompt's words so cards differ
+def fake_value(schema: dict, definitions: dict, words: list, sections: int, name: str = ""):
+    if "$ref" in schema:
+        schema = definitions[schema["$ref"].split("/")[-1]]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: fake_value(value, definitions, words, sections, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        if items.get("type") == "object" or "$ref" in items:
+            # One card per packed section (which fake_value numbers from 1), or two for a single chunk
+            return [fake_value(items, definitions, words, section, name) for section in range(1, max(sections, 2) + 1)]
+        return [fake_value(items, definitions, words, sections, name)]
+    if kind == "integer":
+        return sections
+    if kind == "number":
+        return round(random.random(), 2)
+    if kind == "boolean":
+        return True
+    start = random.randrange(max(len(words) - 8, 1))
+    return f"{name}: " + " ".join(words[start:start + 8])
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+
+    if FAKE_GROQ_RPM:
+        now = time.monotonic()
+        level = min(FAKE_GROQ_RPM, request_budget["level"] + (now - request_budget["updated"]) * FAKE_GROQ_RPM / 60)
+        request_budget.update(level=level, updated=now)
+        if level < 1:
+            return rate_limited("Rate limit reached (requests per minute).", round((1 - level) * 60 / FAKE_GROQ_RPM, 2))
+        request_budget["level"] -= 1
+    if random.random() < FAKE_GROQ_429_RATE:
+        return rate_limited("Rate limit reached.", FAKE_GROQ_RETRY_AFTER)
+
+    await asyncio.sleep((FAKE_GROQ_LATENCY_MS + random.uniform(0, FAKE_GROQ_JITTER_MS)) / 1000)
+
+    prompt = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+    words = re.findall(r"\w+", prompt) or ["text"]
+    sections = len(re.findall(r"^Section \d+:", prompt, re.MULTILINE))
+    message = {"role": "assistant", "content": " ".join(words[:20])}
+    finish_reason = "stop"
+    tools = body.get("tools") or []
+    if tools:
+        function = tools[0]["function"]
+        parameters = function.get("parameters", {})
+        arguments = fake_value(parameters, parameters.get("$defs", {}), words, sections)
+        if random.random() < FAKE_GROQ_BAD_OUTPUT_RATE and (not FAKE_GROQ_BAD_OUTPUT_MODELS or body.get("model") in FAKE_GROQ_BAD_OUTPUT_MODELS):
+            counters["bad_output"] += 1
+            if random.random() < 0.5:
+                return JSONResponse(status_code=400, content={"error": {
+                    "message": "Failed to call a function. Please adjust your prompt.",
+                    "type": "invalid_request_error",
+                    "code": "tool_use_failed",
+                }})
+            arguments = {key: [] for key in arguments}
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments)},
+            }],
+        }
+        finish_reason = "tool_calls"
+
+    counters["completed"] += 1
+    prompt_tokens = len(words)
+    completion_tokens = len(json.dumps(message)) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+@app.get("/stats")
+def stats():
+    return counters
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8001)
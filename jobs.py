@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+from uploads import Upload
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    """SQLite-backed job records, so finished results survive a restart."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def create(self, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO jobs (id, status, params, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(params), now, now),
+            )
+            self.db.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.db.commit()
+
+    def active(self) -> list:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, params FROM jobs WHERE status IN (?, ?) ORDER BY created", ACTIVE_STATUSES
+            ).fetchall()
+        return [(row["id"], json.loads(row["params"])) for row in rows]
+
+
+class JobManager:
+    """Runs queued jobs on a fixed number of background asyncio workers.
+
+    `runner(params, upload)` is an async generator of the same events streamed by /flashcard/
+    ("chunk", "error", "cached", "done"); partial results are kept in memory while a job runs
+    and the assembled result is persisted when it finishes.
+    """
+
+    def __init__(self, store: JobStore, runner, workers: int, input_dir: str):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.input_dir = input_dir
+        self.queue = None
+        self.worker_tasks = []
+        self.running = {}
+        self.partial = {}
+        self.stopping = False
+        os.makedirs(input_dir, exist_ok=True)
+
+    # Start the workers and requeue jobs that were interrupted by the last shutdown
+    async def start(self):
+        self.stopping = False
+        self.queue = asyncio.Queue()
+        for job_id, _ in self.store.active():
+            if os.path.exists(self._input_path(job_id)):
+                self.store.update(job_id, status="queued")
+                self.queue.put_nowait(job_id)
+            else:
+                self.store.update(job_id, status="failed", error="Job input was lost before it could be processed.")
+        self.worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self.stopping = True
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    # Persist the input next to the job record so it can be resumed after a restart; a spooled
+    # upload is moved there rather than copied
+    def submit(self, params: dict, upload: Upload) -> str:
+        job_id = self.store.create(params)
+        upload.save(self._input_path(job_id))
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        result = job["result"] or {}
+        flashcards = result.get("flashcards")
+        if flashcards is None:
+            partial = self.partial.get(job_id, {})
+            flashcards = [card for index in sorted(partial) for card in partial[index]]
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "progress": {"completed": job["completed"], "total": job["total"]},
+            "flashcards": flashcards,
+            "failed_chunks": result.get("failed_chunks", []),
+            "chunks": result.get("chunks"),
+            "chunk_status": result.get("chunk_status"),
+            "duplicates_removed": result.get("duplicates_removed", 0),
+            "stopped": result.get("stopped"),
+            "error": job["error"],
+            "created_at": job["created"],
+            "updated_at": job["updated"],
+        }
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job["status"] in ACTIVE_STATUSES:
+            task = self.running.get(job_id)
+            if task is not None:
+                task.cancel()
+                # Let the job record its cancellation before reporting back
+                await asyncio.wait([task])
+            else:
+                # Still queued: the worker skips it when it is dequeued
+                self.store.update(job_id, status="cancelled")
+                self._remove_input(job_id)
+        return self.status(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                job = self.store.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                task = asyncio.create_task(self._run(job_id, job["params"]))
+                self.running[job_id] = task
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    # A job cancelled through the API is already recorded by _run; keep serving the queue
+                    if self.stopping:
+                        raise
+            finally:
+                self.running.pop(job_id, None)
+                self.queue.task_done()
+
+    async def _run(self, job_id: str, params: dict):
+        self.store.update(job_id, status="running")
+        self.partial[job_id] = partial = {}
+        try:
+            upload = await asyncio.to_thread(Upload.from_file, self._input_path(job_id))
+            finished = False
+            async for event in self.runner(params, upload):
+                if event["event"] == "cached":
+                    partial[0] = event["flashcards"]
+                elif event["event"] == "chunk":
+                    partial[event["chunk"]] = event["flashcards"]
+                if "completed" in event:
+                    self.store.update(job_id, completed=event["completed"], total=event["total"])
+                if event["event"] == "done":
+                    result = {
+                        "flashcards": [card for index in sorted(partial) for card in partial[index]],
+                        **{name: value for name, value in event.items() if name not in ("event", "cached")},
+                    }
+                    total = event["chunks"]["total"]
+                    self.store.update(job_id, status="completed", completed=total, total=total, result=result)
+                    finished = True
+                elif event["event"] == "failed":
+                    # Extraction failed after generation started; the runner reports it in-band
+                    self.store.update(job_id, status="failed", error=event["error"])
+                    finished = True
+            if not finished:
+                self.store.update(job_id, status="failed", error="The job ended before all flashcards were generated.")
+        except asyncio.CancelledError:
+            if self.stopping:
+                # Interrupted by shutdown: leave it queued so the next start resumes it
+                self.store.update(job_id, status="queued")
+            else:
+                flashcards = [card for index in sorted(partial) for card in partial[index]]
+                self.store.update(job_id, status="cancelled", result={"flashcards": flashcards})
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            self.partial.pop(job_id, None)
+            # Only finished jobs drop their input; a job interrupted by shutdown resumes on the next start
+            job = self.store.get(job_id)
+            if job is not None and job["status"] not in ACTIVE_STATUSES:
+                self._remove_input(job_id)
+
+    def _input_path(self, job_id: str) -> str:
+        return os.path.join(self.input_dir, job_id)
+
+    def _remove_input(self, job_id: str):
+        try:
+            os.remove(self._input_path(job_id))
+        except FileNotFoundError:
+            pass
@@ -1,26 +1,164 @@
+import time
+# Taken before the other imports, so the reported startup time includes them
+IMPORT_STARTED = time.perf_counter()
 import os
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import asyncio
+import json
+import logging
+import math
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from typing_extensions import Annotated, TypedDict, List
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, get_type_hints
 from dotenv import load_dotenv
-import PyPDF2
-import pptx  # For PPTX extraction
-import docx  # For DOCX extraction
-import csv   # For CSV extraction
-import io
-from io import BytesIO
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.prompts import ChatPromptTemplate
+from boilerplate import BoilerplateFilter
+from cache import ResultCache, make_key
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, IncrementalSplitter, LocatedChunk, count_tokens, make_splitter, merge_locations
+from dedup import Deduplicator
+from jobs import JobManager, JobStore
+from metrics import (
+    CANCELLED_CALLS,
+    CARDS_PER_REQUEST,
+    CHUNKS,
+    CHUNKS_PER_REQUEST,
+    CLIENT_DISCONNECTS,
+    COMPLETION_TOKENS,
+    EXTRACTION_SECONDS,
+    EARLY_STOPS,
+    FILTERED_TOKENS,
+    LLM_CALL_SECONDS,
+    LLM_WAIT_SECONDS,
+    PROMPT_TOKENS,
+    REQUEST_SECONDS,
+    SPLIT_SECONDS,
+    STARTUP_SECONDS,
+    current_timings,
+    record_stage,
+    register_stats,
+    start_timings,
+)
+from salience import rank_cards, select_chunks
+from scheduler import LLMCallError, LLMScheduler
+from tables import TABLE_METHODS, TableCursor, read_csv_chunks, xlsx_to_csv
+from uploads import RequestSizeLimit, Upload, UploadTooLarge, spool
+from youtube import TranscriptStore, TranscriptUnavailable, load_fetcher, parse_video_id, segment_chunks, video_url
+from extractors import (
+    EXTRACTORS,
+    count_pdf_pages,
+    extract_pdf_pages,
+    extract_units,
+    preload_extractors,
+)
 
 # Load environment variables
 load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
 
+logger = logging.getLogger(__name__)
+
+# Concurrency limits for chunk generation: process-wide cap on in-flight LLM calls
+# and the default per-request cap (a request may ask for less, never more)
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "16"))
+DEFAULT_REQUEST_CONCURRENCY = int(os.getenv("REQUEST_CONCURRENCY", "4"))
+llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+# Document extraction runs in a process pool so CPU-bound parsing never blocks the event loop.
+# EXTRACTION_QUEUE_LIMIT bounds the extractions in flight (running + waiting); past it we shed load with a 503.
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+EXTRACTION_QUEUE_LIMIT = int(os.getenv("EXTRACTION_QUEUE_LIMIT", "8"))
+EXTRACTION_RETRY_AFTER = int(os.getenv("EXTRACTION_RETRY_AFTER", "5"))
+# PDFs are parsed in page batches that start at PDF_PAGE_BATCH pages, so generation can start on the
+# first pages, and double up to PDF_MAX_PAGE_BATCH to keep per-call overhead low on long documents
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", "2"))
+PDF_MAX_PAGE_BATCH = int(os.getenv("PDF_MAX_PAGE_BATCH", "64"))
+# CSV and XLSX rows are grouped into chunks in the workers, TABLE_CHUNK_BATCH chunks per call at first
+# and doubling up to TABLE_MAX_CHUNK_BATCH, so memory stays flat however long the sheet is
+TABLE_CHUNK_BATCH = int(os.getenv("TABLE_CHUNK_BATCH", "4"))
+TABLE_MAX_CHUNK_BATCH = int(os.getenv("TABLE_MAX_CHUNK_BATCH", "64"))
+extraction_pool = None
+pending_extractions = 0
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    global extraction_pool
+    if extraction_pool is None:
+        extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+    return extraction_pool
+
+# Whole-document result cache, keyed on the input plus everything that shapes the output.
+# Set RESULT_CACHE_PATH to an empty string to keep the cache in memory only.
+DATA_DIR = os.getenv("FLASHYGEN_DATA_DIR", ".flashygen")
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(DATA_DIR, "results.db"))
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("RESULT_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MEMORY_BYTES, RESULT_CACHE_DISK_BYTES)
+
+# Per-chunk cache of LLM output, so re-uploads of an edited document only regenerate the chunks that changed
+CHUNK_CACHE_PATH = os.getenv("CHUNK_CACHE_PATH", os.path.join(DATA_DIR, "chunks.db"))
+CHUNK_CACHE_MEMORY_BYTES = int(os.getenv("CHUNK_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CHUNK_CACHE_DISK_BYTES = int(os.getenv("CHUNK_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+chunk_cache = ResultCache(CHUNK_CACHE_PATH, CHUNK_CACHE_MEMORY_BYTES, CHUNK_CACHE_DISK_BYTES)
+
+# Transcripts of YouTube videos (method=youtube), cached by video id so popular videos are fetched once.
+# TRANSCRIPT_FETCHER names the function fetching a transcript as "module:function"; set it to
+# youtube:fetch_from_directory to read transcripts from TRANSCRIPT_DIR instead of YouTube.
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", os.path.join(DATA_DIR, "transcripts.db"))
+TRANSCRIPT_CACHE_MEMORY_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+TRANSCRIPT_CACHE_DISK_BYTES = int(os.getenv("TRANSCRIPT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+TRANSCRIPT_FETCHER = os.getenv("TRANSCRIPT_FETCHER", "youtube:fetch_from_youtube")
+transcript_cache = ResultCache(TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_MEMORY_BYTES, TRANSCRIPT_CACHE_DISK_BYTES)
+transcript_store = TranscriptStore(transcript_cache, load_fetcher(TRANSCRIPT_FETCHER))
+
+# Batches of documents generated in one request: at most BATCH_MAX_DOCUMENTS documents, sharing
+# BATCH_CONCURRENCY in-flight LLM calls unless the request asks for another limit
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "50"))
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Background jobs for documents too large to process within a request timeout
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(DATA_DIR, "jobs.db"))
+
+# Uploads are spooled to files in UPLOAD_SPOOL_DIR a block at a time, and workers parse them from there.
+# MAX_UPLOAD_BYTES caps each file and MAX_BATCH_UPLOAD_BYTES all files of a batch (0 for no limit).
+# Requests declaring a body larger than their route's limit, plus room for the form fields, are refused
+# unread: the batch limit for /batch and the per-file limit for every other route.
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(DATA_DIR, "uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+FORM_FIELD_BYTES = 1024 * 1024
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES and MAX_UPLOAD_BYTES + FORM_FIELD_BYTES
+MAX_BATCH_REQUEST_BYTES = MAX_BATCH_UPLOAD_BYTES and MAX_BATCH_UPLOAD_BYTES + FORM_FIELD_BYTES
+
+# Parser libraries, LLM clients and extraction workers are loaded on first use. Set WARM_UP=1 to load
+# them before the server starts accepting requests instead, trading a slower start for a fast first request.
+WARM_UP = os.getenv("WARM_UP", "0").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if WARM_UP:
+        warm_up()
+    warm_up_seconds = time.perf_counter() - started
+    STARTUP_SECONDS.labels("import").set(IMPORT_SECONDS)
+    STARTUP_SECONDS.labels("warm_up").set(warm_up_seconds)
+    logger.info("Started in %.2fs (imports %.2fs, warm-up %.2fs)", IMPORT_SECONDS + warm_up_seconds, IMPORT_SECONDS, warm_up_seconds)
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    if extraction_pool is not None:
+        extraction_pool.shutdown(cancel_futures=True)
+
 # Set up FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(RequestSizeLimit, limit=MAX_REQUEST_BYTES, limits={"/batch": MAX_BATCH_REQUEST_BYTES})
 
 # Enable CORS for all origins, can be restricted in production
 app.add_middleware(
@@ -29,6 +167,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the per-request timing breakdown
+    expose_headers=["Server-Timing"],
 )
 
 class Flashcard(TypedDict):
@@ -52,45 +192,107 @@ class ClozeDeletionFlashcardSet(TypedDict):
     """Set of cloze deletion flashcards."""
     flashcards: Annotated[List[ClozeDeletionFlashcard], "A list of fill-in-the-blank flashcards based on the input text."]
 
-# Text extraction functions
-def extract_text_from_pdf(file) -> str:
-    reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
-
-def extract_text_from_pptx(file) -> str:
-    file_bytes = BytesIO(file.read())
-    presentation = pptx.Presentation(file_bytes)
-    text = ""
-    for slide in presentation.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text += shape.text + "\n"
-    file.seek(0)
-    return text
-
-def extract_text_from_docx(file) -> str:
-    file_bytes = BytesIO(file.read())
-    doc = docx.Document(file_bytes)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    file.seek(0)
-    return text
-
-def extract_text_from_csv(file) -> str:
-    decoded_file = io.StringIO(file.read().decode("utf-8"))
-    text = ""
-    reader = csv.reader(decoded_file)
-    for row in reader:
-        text += " ".join(row) + "\n"
-    file.seek(0)
-    return text
-
-# Set up the LLM
-llm = ChatGroq(temperature=0, model="llama3-8b-8192")
+# Packed variants attribute each flashcard to the numbered section (chunk) it was generated from
+class PackedFlashcard(TypedDict):
+    """Flashcard attributed to a section of the input."""
+    section: Annotated[int, "The number of the section this flashcard was generated from"]
+    question: Annotated[str, "The question or prompt on the front of the flashcard"]
+    answer: Annotated[str, "The answer or explanation on the back of the flashcard"]
+
+class PackedFlashcardSet(TypedDict):
+    """Set of flashcards for several numbered sections."""
+    flashcards: Annotated[List[PackedFlashcard], "A list of flashcards covering every section of the input text"]
+
+class PackedClozeDeletionFlashcard(TypedDict):
+    """Cloze deletion flashcard attributed to a section of the input."""
+    section: Annotated[int, "The number of the section this flashcard was generated from"]
+    question_with_blanks: Annotated[str, "A sentence with one or more blanks (____) for the learner to fill in."]
+    correct_answers: Annotated[List[str], "The list of correct words or phrases that fill in the blanks."]
+
+class PackedClozeDeletionFlashcardSet(TypedDict):
+    """Set of cloze deletion flashcards for several numbered sections."""
+    flashcards: Annotated[List[PackedClozeDeletionFlashcard], "A list of fill-in-the-blank flashcards covering every section of the input text."]
+
+# Set up the LLMs. Chunks go to the fast MODEL_NAME first and are escalated to ESCALATION_MODEL only
+# when its structured output fails validation or comes back empty; set ESCALATION_MODEL to an empty
+# string to disable escalation. Retries are left to the scheduler below, which knows about the rate limits.
+# Set GROQ_API_BASE to point the clients at another endpoint, such as fake_groq.py.
+MODEL_NAME = "llama3-8b-8192"
+ESCALATION_MODEL = os.getenv("ESCALATION_MODEL", "llama3-groq-70b-8192-tool-use-preview")
+MODEL_TIERS = [MODEL_NAME] + ([ESCALATION_MODEL] if ESCALATION_MODEL else [])
+
+# Clients are created on first use, so starting the server doesn't wait for the Groq client stack to
+# load; stand-ins (such as the benchmark's fake LLM) can be placed in llms beforehand
+llms = {}
+structured_llms = {}
+
+def get_llm(model: str):
+    if model not in llms:
+        from langchain_groq import ChatGroq
+        llms[model] = ChatGroq(temperature=0, model=model, max_retries=0)
+    return llms[model]
+
+# Structured-output wrapper for a model and flashcard schema, built once and reused by every request.
+# include_raw keeps the provider's token usage alongside the parsed cards.
+def get_structured_llm(model: str, schema):
+    key = (model, schema)
+    if key not in structured_llms:
+        structured_llms[key] = get_llm(model).with_structured_output(schema, include_raw=True)
+    return structured_llms[key]
+
+# In-flight calls per model, within the process-wide MAX_CONCURRENT_LLM_CALLS
+MODEL_CONCURRENCY = {
+    MODEL_NAME: int(os.getenv("LLM_CONCURRENCY", str(MAX_CONCURRENT_LLM_CALLS))),
+    ESCALATION_MODEL: int(os.getenv("ESCALATION_CONCURRENCY", "4")),
+}
+model_semaphores = {model: asyncio.Semaphore(MODEL_CONCURRENCY[model]) for model in MODEL_TIERS}
+
+# Rate limits per model as (requests per minute, tokens per minute), 0 for no limit; the defaults are
+# Groq's free-tier limits. Calls queue until they fit, and 429s and server errors are retried with
+# jittered exponential backoff, waiting at least as long as the Retry-After header asks.
+MODEL_RATE_LIMITS = {
+    MODEL_NAME: (int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30")), int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))),
+    ESCALATION_MODEL: (
+        int(os.getenv("ESCALATION_REQUESTS_PER_MINUTE", "30")), int(os.getenv("ESCALATION_TOKENS_PER_MINUTE", "15000")),
+    ),
+}
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+# Tokens reserved for the tool schema and the generated cards on top of the prompt
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("COMPLETION_TOKEN_ESTIMATE", "500"))
+llm_scheduler = LLMScheduler(
+    MODEL_RATE_LIMITS, MODEL_RATE_LIMITS[MODEL_NAME], LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+
+# Chunk size and overlap in tokens for each model; requests may override both
+MODEL_CHUNK_TOKENS = {
+    "llama3-8b-8192": (DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS),
+}
+MAX_CHUNK_TOKENS = 2000
+
+# Default input-token budget for packing several chunks into one LLM call (0 disables packing).
+# The packed prompt and the generated cards must still fit in the model's context window.
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", "0"))
+
+# Default similarity (0-1) above which a flashcard counts as a near-duplicate of an earlier one (0 disables).
+# Overlapping chunks often yield the same card more than once.
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+
+# Boilerplate filter for paged documents (BOILERPLATE_METHODS): lines on at least BOILERPLATE_MIN_PAGES
+# pages (headers, footers, copyright lines), page numbers and table-of-contents entries are dropped
+# before splitting, and chunks with fewer than MIN_CHUNK_WORDS content words after it. Set
+# BOILERPLATE_FILTER=0 to disable it, or BOILERPLATE_MIN_PAGES=0 to keep repeated lines.
+BOILERPLATE_FILTER = os.getenv("BOILERPLATE_FILTER", "1").lower() in ("1", "true", "yes")
+BOILERPLATE_METHODS = ("pdf", "pptx", "docx")
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+MIN_CHUNK_WORDS = int(os.getenv("MIN_CHUNK_WORDS", "4"))
+
+# Cards a chunk typically yields, for turning a max_cards budget into the number of chunks to generate
+CARDS_PER_CHUNK = float(os.getenv("CARDS_PER_CHUNK", "3"))
+# Chunks picked for max_cards, as a multiple of the chunks expected to be needed. The spares are only
+# generated when earlier chunks yield fewer cards than expected or duplicates.
+SELECTION_RESERVE = float(os.getenv("SELECTION_RESERVE", "2"))
 
 # Define prompts for different flashcard types
 normal_prompt = ChatPromptTemplate.from_messages([
@@ -107,67 +309,1381 @@ cloze_prompt = ChatPromptTemplate.from_messages([
      "to test the learner's memory. Provide the correct word or phrase for each blank in the answer.")
 ])
 
+# Prompts for packing several chunks into one call; sections are numbered from 1
+packed_normal_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "Generate a set of flashcards from the given text. Focus on key concepts and important information. "
+     "The text is split into numbered sections; set the section of every flashcard to the number of the section it comes from."),
+    ("human", "{sections}\n\nGenerate a list of flashcards covering every section of this text.")
+])
+
+packed_cloze_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "Generate a set of cloze deletion flashcards from the given text. "
+     "Focus on creating simple fill-in-the-blank questions for key facts or important information. "
+     "The text is split into numbered sections; set the section of every flashcard to the number of the section it comes from."),
+    ("human",
+     "{sections}\n\nCreate flashcards covering every section using simple cloze deletions. For each flashcard, replace key information "
+     "with blanks (____) to test the learner's memory. Provide the correct word or phrase for each blank in the answer.")
+])
+
+FLASHCARD_TYPES = {
+    "type-I": (FlashcardSet, normal_prompt, PackedFlashcardSet, packed_normal_prompt),
+    "type-II": (ClozeDeletionFlashcardSet, cloze_prompt, PackedClozeDeletionFlashcardSet, packed_cloze_prompt),
+}
+
+# Escalation counters: how many chunks each model was asked for and answered, and why chunks moved up a tier
+class EscalationStats:
+    def __init__(self, models: list):
+        self.models = models
+        self.requested = {model: 0 for model in models}
+        self.answered = {model: 0 for model in models}
+        self.reasons = {"error": 0, "invalid": 0, "empty": 0}
+
+    def escalated(self, reason: str):
+        self.reasons[reason] += 1
+
+    def snapshot(self) -> dict:
+        chunks = self.requested[self.models[0]]
+        escalated = sum(self.reasons.values())
+        return {
+            "tiers": self.models,
+            "chunks": chunks,
+            "escalated": escalated,
+            "escalation_rate": escalated / chunks if chunks else 0.0,
+            "reasons": dict(self.reasons),
+            "requested": dict(self.requested),
+            "answered": dict(self.answered),
+        }
+
+escalation_stats = EscalationStats(MODEL_TIERS)
+
+# Everything about how a request's input is chunked and the chunks are turned into flashcards.
+# type is the flashcard type; models lists (model name, structured-output LLM) in escalation order; card_fields maps each
+# flashcard field to its type, for validating the output. pack_tokens > 0 packs several chunks
+# into one call of up to that many input tokens. max_cards and token_budget > 0 limit generation to
+# the most informative chunks and rank the deck by importance. max_cards and deadline_ms > 0 generate
+# the most informative chunks first and stop once max_cards cards are kept or the deadline passes.
+# sample_rows > 0 reads about that many rows of a CSV or XLSX sheet, spread over the whole sheet.
+class GenerationPlan(NamedTuple):
+    type: str
+    models: tuple
+    card_fields: dict
+    prompt: ChatPromptTemplate
+    packed_llm: object
+    packed_prompt: ChatPromptTemplate
+    pack_tokens: int
+    chunk_tokens: int
+    overlap_tokens: int
+    concurrency: int
+    dedup_threshold: float
+    max_cards: int
+    token_budget: int
+    sample_rows: int
+    deadline_ms: int
+    # Everything besides the chunk text that shapes the output, for cache keys
+    cache_scope: tuple
+
+# Build the generation plan for a request, validating the flashcard type and chunking parameters
+def make_plan(type: str, concurrency: Optional[int] = None, pack_tokens: Optional[int] = None,
+              chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+              dedup_threshold: Optional[float] = None, max_cards: Optional[int] = None,
+              token_budget: Optional[int] = None, sample_rows: Optional[int] = None,
+              deadline_ms: Optional[int] = None) -> GenerationPlan:
+    if type not in FLASHCARD_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid type specified.")
+    schema, prompt, packed_schema, packed_prompt = FLASHCARD_TYPES[type]
+
+    default_chunk_tokens, default_overlap_tokens = MODEL_CHUNK_TOKENS.get(MODEL_NAME, (DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS))
+    chunk_tokens = chunk_tokens or default_chunk_tokens
+    overlap_tokens = overlap_tokens if overlap_tokens is not None else min(default_overlap_tokens, chunk_tokens // 2)
+    if not 1 <= chunk_tokens <= MAX_CHUNK_TOKENS or not 0 <= overlap_tokens < chunk_tokens:
+        raise HTTPException(status_code=400, detail="Invalid chunk size or overlap specified.")
+
+    dedup_threshold = dedup_threshold if dedup_threshold is not None else DEDUP_THRESHOLD
+    if not 0 <= dedup_threshold <= 1:
+        raise HTTPException(status_code=400, detail="Invalid dedup threshold specified.")
+
+    max_cards = max_cards or 0
+    token_budget = token_budget or 0
+    if max_cards < 0 or token_budget < 0:
+        raise HTTPException(status_code=400, detail="Invalid max_cards or token_budget specified.")
+    sample_rows = sample_rows or 0
+    if sample_rows < 0:
+        raise HTTPException(status_code=400, detail="Invalid sample_rows specified.")
+    deadline_ms = deadline_ms or 0
+    if deadline_ms < 0:
+        raise HTTPException(status_code=400, detail="Invalid deadline_ms specified.")
+
+    pack_tokens = max(pack_tokens if pack_tokens is not None else PACK_TOKEN_BUDGET, 0)
+    cache_scope = (type, *MODEL_TIERS, prompt.pretty_repr())
+    if pack_tokens:
+        cache_scope += (packed_prompt.pretty_repr(), str(pack_tokens))
+    return GenerationPlan(
+        type=type,
+        models=tuple((model, get_structured_llm(model, schema)) for model in MODEL_TIERS),
+        card_fields=get_type_hints(get_type_hints(schema)["flashcards"].__args__[0]),
+        prompt=prompt,
+        packed_llm=get_structured_llm(MODEL_NAME, packed_schema),
+        packed_prompt=packed_prompt,
+        pack_tokens=pack_tokens,
+        chunk_tokens=chunk_tokens,
+        overlap_tokens=overlap_tokens,
+        concurrency=min(max(concurrency or DEFAULT_REQUEST_CONCURRENCY, 1), MAX_CONCURRENT_LLM_CALLS),
+        dedup_threshold=dedup_threshold,
+        max_cards=max_cards,
+        token_budget=token_budget,
+        sample_rows=sample_rows,
+        deadline_ms=deadline_ms,
+        cache_scope=cache_scope,
+    )
+
+# Load everything the first requests would otherwise wait for: the parser libraries, the LLM clients
+# and structured-output wrappers of every flashcard type, and the extraction workers
+def warm_up():
+    preload_extractors()
+    for type in FLASHCARD_TYPES:
+        make_plan(type)
+    pool = get_extraction_pool()
+    for future in [pool.submit(preload_extractors) for _ in range(EXTRACTION_WORKERS)]:
+        future.result()
+
+# Spool an uploaded file to UPLOAD_SPOOL_DIR without reading it into memory, refusing it with a 413
+# once it passes `limit` bytes. The copy runs in a thread, as Starlette may have rolled the upload over to disk.
+async def spool_upload(file: UploadFile, limit: int) -> Upload:
+    too_large = HTTPException(status_code=413, detail=f"{file.filename} is larger than the upload limit of {limit} bytes.")
+    if limit and file.size is not None and file.size > limit:
+        raise too_large
+    suffix = os.path.splitext(file.filename or "")[1]
+    try:
+        return await asyncio.to_thread(spool, file.file, UPLOAD_SPOOL_DIR, limit, suffix)
+    except UploadTooLarge:
+        raise too_large
+
+# Read the raw input based on the method: files are spooled to disk, text stays in memory
+async def read_input(method: str, text: Optional[str], file: Optional[UploadFile]) -> Upload:
+    if method in EXTRACTORS:
+        if not file or not file.filename.endswith(f".{method}"):
+            raise HTTPException(status_code=400, detail=f"Please upload a valid {method.upper()} file.")
+        return await spool_upload(file, MAX_UPLOAD_BYTES)
+    if method == "text":
+        if not text:
+            raise HTTPException(status_code=400, detail="Please provide valid text input.")
+        return Upload.from_bytes(text.encode("utf-8"))
+    if method == "youtube":
+        # The video id stands in for the input, so the result cache is keyed by video
+        video_id = parse_video_id(text or "")
+        if video_id is None:
+            raise HTTPException(status_code=400, detail="Please provide a valid YouTube URL or video id.")
+        return Upload.from_bytes(video_id.encode("utf-8"))
+    raise HTTPException(status_code=400, detail="Invalid method specified.")
+
+# Boilerplate filter for one document of the given method, or None when it isn't filtered
+def make_content_filter(method: str) -> Optional[BoilerplateFilter]:
+    if not BOILERPLATE_FILTER or method not in BOILERPLATE_METHODS:
+        return None
+    return BoilerplateFilter(BOILERPLATE_MIN_PAGES, MIN_CHUNK_WORDS)
+
+def boilerplate_settings(method: str) -> str:
+    return f"{BOILERPLATE_MIN_PAGES}/{MIN_CHUNK_WORDS}" if make_content_filter(method) else "off"
+
+# Key for the whole-document result cache. Deduplication and the budgets only decide which cards
+# make up the deck, so they are part of this key but not of the chunk cache key. Decks cut short by
+# the deadline are never cached, but a deadline changes the order chunks are generated in.
+def result_cache_key(method: str, upload: Upload, plan: GenerationPlan) -> str:
+    return make_key(
+        method, upload.digest, *plan.cache_scope,
+        f"tokens:{plan.chunk_tokens}/{plan.overlap_tokens}", f"dedup:{plan.dedup_threshold}",
+        f"budget:{plan.max_cards}/{plan.token_budget}/{bool(plan.deadline_ms)}", f"filter:{boilerplate_settings(method)}",
+        f"sample:{plan.sample_rows if method in TABLE_METHODS else 0}",
+    )
+
+
+class ExtractionReservation:
+    """One of the pending extractions counted against EXTRACTION_QUEUE_LIMIT, held from admission until
+    the document has been extracted. Closing it more than once has no further effect, so both the
+    extraction and the request that admitted it can close it."""
+
+    def __init__(self):
+        global pending_extractions
+        pending_extractions += 1
+        self.held = True
+
+    def close(self):
+        global pending_extractions
+        if self.held:
+            pending_extractions -= 1
+            self.held = False
+
+# Reserve a place in the worker pool queue, or reject the request with a 503 when it is full. The check
+# and the reservation happen in one step, so concurrent requests can't all pass the check.
+def ensure_extraction_capacity() -> ExtractionReservation:
+    if pending_extractions >= EXTRACTION_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy extracting other documents. Please retry later.",
+            headers={"Retry-After": str(EXTRACTION_RETRY_AFTER)},
+        )
+    return ExtractionReservation()
+
+# Extract PDF pages in batches across the worker pool, yielding one unit per page in order while later
+# batches are still being parsed. Workers all map the one spooled file instead of each getting a copy,
+# and unmap it after the last batch so the file's space is freed once the upload is deleted.
+async def iter_pdf_text(path: str):
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    page_count = await loop.run_in_executor(pool, count_pdf_pages, path)
+
+    # Keep one batch in flight per worker: enough to overlap parsing with generation
+    # without holding the whole document in memory
+    pending = deque()
+    try:
+        start = 0
+        batch = PDF_PAGE_BATCH
+        while start < page_count:
+            stop = min(start + batch, page_count)
+            pending.append(loop.run_in_executor(pool, extract_pdf_pages, path, start, stop, stop == page_count))
+            start = stop
+            batch = min(batch * 2, PDF_MAX_PAGE_BATCH)
+            if len(pending) >= EXTRACTION_WORKERS:
+                for page in await pending.popleft():
+                    yield page
+        while pending:
+            for page in await pending.popleft():
+                yield page
+    finally:
+        for future in pending:
+            future.cancel()
+
+# Chunks of a CSV or XLSX sheet, each a group of rows under the header row, read by the workers a batch
+# at a time while earlier chunks are generated. Workers read the spooled upload, XLSX sheets after
+# converting them to CSV with a streaming reader. Chunks carry the rows they cover as their location.
+async def iter_table_chunks(method: str, path: str, plan: GenerationPlan):
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=UPLOAD_SPOOL_DIR) as directory:
+        if method == "xlsx":
+            await loop.run_in_executor(pool, xlsx_to_csv, path, os.path.join(directory, "sheet.csv"))
+            path = os.path.join(directory, "sheet.csv")
+
+        # Keep the next batch in flight while this one is generated
+        batch = TABLE_CHUNK_BATCH
+        pending = loop.run_in_executor(pool, read_csv_chunks, path, TableCursor(), plan.chunk_tokens, plan.sample_rows, batch)
+        try:
+            while pending is not None:
+                chunks, cursor = await pending
+                pending = None
+                if cursor is not None:
+                    batch = min(batch * 2, TABLE_MAX_CHUNK_BATCH)
+                    pending = loop.run_in_executor(pool, read_csv_chunks, path, cursor, plan.chunk_tokens, plan.sample_rows, batch)
+                for text, first_row, last_row in chunks:
+                    yield LocatedChunk(text, {"rows": [first_row, last_row]})
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+# Workers get the path of the spooled upload, never its bytes
+async def iter_raw_text(method: str, upload: Upload, plan: GenerationPlan):
+    if method not in EXTRACTORS:
+        for piece in upload.iter_text():
+            yield piece
+    elif method in TABLE_METHODS:
+        async for chunk in iter_table_chunks(method, upload.path, plan):
+            yield chunk
+    elif method == "pdf":
+        async for page in iter_pdf_text(upload.path):
+            yield page
+    else:
+        loop = asyncio.get_running_loop()
+        for unit in await loop.run_in_executor(get_extraction_pool(), extract_units, method, upload.path):
+            yield unit
+
+# Yield the extracted input piece by piece, parsing files in the worker pool: text for text input,
+# units (see extractors.py) for PDF, PPTX and DOCX files, and ready-made chunks for tables. Extraction time excludes the time spent suspended while the consumer handles each piece.
+# Files are counted as pending extractions under the request's reservation, or under one of their own.
+async def iter_extracted_text(method: str, upload: Upload, plan: GenerationPlan,
+                              reservation: Optional[ExtractionReservation] = None):
+    if method in EXTRACTORS and reservation is None:
+        reservation = ExtractionReservation()
+    elapsed = 0.0
+    try:
+        resumed = time.perf_counter()
+        async for piece in iter_raw_text(method, upload, plan):
+            elapsed += time.perf_counter() - resumed
+            yield piece
+            resumed = time.perf_counter()
+        elapsed += time.perf_counter() - resumed
+        EXTRACTION_SECONDS.labels(method).observe(elapsed)
+    finally:
+        record_stage("extract", elapsed)
+        if reservation is not None:
+            reservation.close()
+
+# Split a stream of text into chunks incrementally, emitting the same chunks as splitting the whole
+# text would while later pieces are still being extracted (see IncrementalSplitter)
+async def iter_chunks(pieces, plan: GenerationPlan):
+    splitter = IncrementalSplitter(plan.chunk_tokens, plan.overlap_tokens)
+    elapsed = 0.0
+    try:
+        async for piece in pieces:
+            started = time.perf_counter()
+            chunks = splitter.feed(piece)
+            elapsed += time.perf_counter() - started
+            for chunk in chunks:
+                yield chunk
+        started = time.perf_counter()
+        chunks = splitter.finish()
+        elapsed += time.perf_counter() - started
+        SPLIT_SECONDS.observe(elapsed)
+        for chunk in chunks:
+            yield chunk
+    finally:
+        record_stage("split", elapsed)
+
+# Fetch a video's transcript ahead of generation, so an unavailable transcript is reported as an error response
+async def load_transcript(video_id: str):
+    try:
+        await transcript_store.get(video_id)
+    except TranscriptUnavailable as e:
+        raise HTTPException(status_code=404, detail=f"No transcript is available for this video: {e}")
+    except Exception:
+        logger.exception("Fetching the transcript of %s failed", video_id)
+        raise HTTPException(status_code=502, detail="Could not fetch the transcript. Please retry later.")
+
+# Chunk a video's transcript along segment boundaries, each chunk carrying the time span it covers
+async def iter_transcript_chunks(video_id: str, plan: GenerationPlan):
+    started = time.perf_counter()
+    segments = await transcript_store.get(video_id)
+    fetched = time.perf_counter()
+    chunks = segment_chunks(segments, plan.chunk_tokens, plan.overlap_tokens)
+    split = time.perf_counter() - fetched
+    EXTRACTION_SECONDS.labels("youtube").observe(fetched - started)
+    SPLIT_SECONDS.observe(split)
+    record_stage("extract", fetched - started)
+    record_stage("split", split)
+    for chunk in chunks:
+        yield LocatedChunk(chunk["text"], {
+            "start": round(chunk["start"], 2), "end": round(chunk["end"], 2), "url": video_url(video_id, chunk["start"]),
+        })
+
+def located_chunk(text: str, locations: list) -> str:
+    location = merge_locations(locations)
+    return LocatedChunk(text, location) if location else text
+
+# Pack whole units (pages, slides, sections) into chunks of up to plan.chunk_tokens, so chunks follow
+# the document's own boundaries and need no overlap. Only units too large for one chunk are split,
+# with the usual overlap. Each chunk carries the locations of its units.
+async def iter_unit_chunks(units, plan: GenerationPlan):
+    splitter = make_splitter(plan.chunk_tokens, plan.overlap_tokens)
+    pack = []
+    pack_tokens = 0
+    elapsed = 0.0
+
+    def packed() -> str:
+        return located_chunk("\n".join(unit["text"] for unit in pack), [unit["location"] for unit in pack])
+
+    try:
+        async for unit in units:
+            started = time.perf_counter()
+            ready = []
+            if unit["text"].strip():
+                tokens = count_tokens(unit["text"])
+                if pack and pack_tokens + tokens > plan.chunk_tokens:
+                    ready.append(packed())
+                    pack, pack_tokens = [], 0
+                if tokens > plan.chunk_tokens:
+                    ready.extend(located_chunk(piece, [unit["location"]]) for piece in splitter.split_text(unit["text"]))
+                else:
+                    pack.append(unit)
+                    pack_tokens += tokens
+            elapsed += time.perf_counter() - started
+            for chunk in ready:
+                yield chunk
+        if pack:
+            yield packed()
+        SPLIT_SECONDS.observe(elapsed)
+    finally:
+        record_stage("split", elapsed)
+
+# Extract the input and chunk it as it becomes available: text is split, units are packed (after the
+# content filter, if any, has cleaned them) and tables are chunked as they are read. With
+# extraction_slots, a slot is held while the input is extracted. The reservation, if any, is closed once
+# the input has been extracted.
+def extract_chunks(method: str, upload: Upload, plan: GenerationPlan, content_filter: Optional[BoilerplateFilter] = None,
+                   extraction_slots: Optional[asyncio.Semaphore] = None, reservation: Optional[ExtractionReservation] = None):
+    if method == "youtube":
+        return iter_transcript_chunks(upload.text(), plan)
+    pieces = iter_extracted_text(method, upload, plan, reservation)
+    if extraction_slots is not None:
+        pieces = hold_slot(pieces, extraction_slots)
+    if method in TABLE_METHODS:
+        return pieces
+    if method not in EXTRACTORS:
+        return iter_chunks(pieces, plan)
+    if content_filter is None:
+        return iter_unit_chunks(pieces, plan)
+    return content_filter.filter_chunks(iter_unit_chunks(content_filter.filter_units(pieces), plan))
+
+# Collapse whitespace so re-extraction noise (line wrapping, trailing spaces) doesn't defeat the chunk cache
+def normalize_chunk(chunk: str) -> str:
+    return " ".join(chunk.split())
+
+def chunk_cache_key(plan: GenerationPlan, chunk: str) -> str:
+    return make_key(*plan.cache_scope, normalize_chunk(chunk))
+
+# Send a prompt through the concurrency limits and the rate-limit scheduler; returns the parsed response
+# and the attempts it took. Call latency and token usage are recorded per attempt and per call.
+async def invoke_llm(model: str, structured_llm, prompt: str, request_semaphore: asyncio.Semaphore, type: str) -> tuple:
+    tokens = count_tokens(prompt) + COMPLETION_TOKEN_ESTIMATE
+    started = time.perf_counter()
+    calling = 0.0
+    sent = False
+
+    async def call():
+        nonlocal calling, sent
+        sent = True
+        call_started = time.perf_counter()
+        try:
+            return await structured_llm.ainvoke(prompt)
+        finally:
+            seconds = time.perf_counter() - call_started
+            calling += seconds
+            LLM_CALL_SECONDS.labels(model, type).observe(seconds)
+
+    try:
+        # Take the narrower slots first so a waiting call never holds a global slot
+        async with request_semaphore:
+            async with model_semaphores[model]:
+                async with llm_semaphore:
+                    output, attempts = await llm_scheduler.call(model, tokens, call)
+    except asyncio.CancelledError:
+        # The request no longer needs the cards: its client went away, it has enough cards, or its job was cancelled
+        CANCELLED_CALLS.labels(model, "sent" if sent else "queued").inc()
+        raise
+    finally:
+        waited = time.perf_counter() - started - calling
+        LLM_WAIT_SECONDS.labels(model).observe(waited)
+        record_stage("llm", calling)
+        record_stage("llm_wait", waited)
+
+    parsed = output["parsed"]
+    # Fall back to estimates when the provider doesn't report usage
+    usage = output["raw"].usage_metadata or {
+        "input_tokens": count_tokens(prompt), "output_tokens": count_tokens(json.dumps(parsed)),
+    }
+    PROMPT_TOKENS.labels(model).inc(usage["input_tokens"])
+    COMPLETION_TOKENS.labels(model).inc(usage["output_tokens"])
+    return parsed, attempts
+
+# Check a card against the flashcard type's fields: non-empty strings, or non-empty lists of them
+def valid_card(card, card_fields: dict) -> bool:
+    if not isinstance(card, dict):
+        return False
+    for name, kind in card_fields.items():
+        value = card.get(name)
+        if kind is str:
+            if not isinstance(value, str) or not value.strip():
+                return False
+        elif not isinstance(value, list) or not value or not all(isinstance(item, str) and item.strip() for item in value):
+            return False
+    return True
+
+# Flashcards generated for one chunk, the LLM calls it took and the model that produced them
+class Generation(NamedTuple):
+    flashcards: list
+    attempts: int
+    model: str
+
+# Generate flashcards for a single chunk through the async LLM path, escalating to the next model tier
+# when the output is unusable, and remember them in the chunk cache. Malformed cards are dropped; a
+# chunk is escalated when the call fails on its output, or no valid cards remain.
+async def generate_chunk_flashcards(plan: GenerationPlan, chunk: str, request_semaphore: asyncio.Semaphore) -> Generation:
+    prompt = plan.prompt.format(chunk=chunk)
+    attempts = 0
+    for tier, (model, structured_llm) in enumerate(plan.models):
+        last_tier = tier == len(plan.models) - 1
+        escalation_stats.requested[model] += 1
+        try:
+            response, tries = await invoke_llm(model, structured_llm, prompt, request_semaphore, plan.type)
+        except LLMCallError as e:
+            attempts += e.attempts
+            # Rate limits and outages would hit the larger model too
+            if e.transient or last_tier:
+                e.attempts = attempts
+                raise
+            reason = "error"
+        else:
+            attempts += tries
+            cards = response.get('flashcards') if isinstance(response, dict) else None
+            flashcards = [card for card in cards if valid_card(card, plan.card_fields)] if isinstance(cards, list) else []
+            if flashcards or last_tier:
+                escalation_stats.answered[model] += 1
+                chunk_cache.put(chunk_cache_key(plan, chunk), {"flashcards": flashcards})
+                return Generation(flashcards, attempts, model)
+            reason = "empty" if cards == [] else "invalid"
+        escalation_stats.escalated(reason)
+        logger.info("Escalating chunk from %s to %s (%s output)", model, plan.models[tier + 1][0], reason)
+
+# Generate flashcards for several chunks in one call, splitting the cards back out by section.
+# Raises ValueError when the response can't be attributed, so the caller can fall back to single-chunk calls.
+# Sections the response skipped come back empty and are not cached, for the caller to regenerate one by one.
+async def generate_packed_flashcards(plan: GenerationPlan, pack: list, request_semaphore: asyncio.Semaphore) -> tuple:
+    sections = "\n\n".join(f"Section {number}:\n{chunk}" for number, (_, chunk) in enumerate(pack, 1))
+    response, attempts = await invoke_llm(
+        MODEL_NAME, plan.packed_llm, plan.packed_prompt.format(sections=sections), request_semaphore, plan.type,
+    )
+    if not isinstance(response, dict) or not isinstance(response.get('flashcards'), list) or not response['flashcards']:
+        raise ValueError("Packed response contained no flashcards")
+
+    results = {index: [] for index, _ in pack}
+    for card in response['flashcards']:
+        if not valid_card(card, plan.card_fields):
+            raise ValueError(f"Packed response contained an invalid flashcard: {card!r}")
+        section = card.get('section')
+        if not isinstance(section, int) or not 1 <= section <= len(pack):
+            raise ValueError(f"Packed response referenced unknown section {section!r}")
+        results[pack[section - 1][0]].append({key: value for key, value in card.items() if key != 'section'})
+
+    answered = [(index, chunk) for index, chunk in pack if results[index]]
+    for index, chunk in answered:
+        chunk_cache.put(chunk_cache_key(plan, chunk), {"flashcards": results[index]})
+    # Only answered sections are counted; the others are counted when regenerated one by one
+    escalation_stats.requested[MODEL_NAME] += len(answered)
+    escalation_stats.answered[MODEL_NAME] += len(answered)
+    return results, attempts
+
+# Outcome of one chunk. attempts counts LLM calls including retries and escalations (0 when reused
+# from the cache; for a packed call, only the pack's first chunk counts its retries) and model is the
+# model that answered; total is the number of non-empty chunks, or None while the input is still being split.
+class ChunkResult(NamedTuple):
+    index: int
+    flashcards: list
+    reused: bool
+    error: Optional[Exception]
+    tokens: int
+    attempts: int
+    model: Optional[str]
+    total: Optional[int]
+
+def budgeted(plan: GenerationPlan) -> bool:
+    return bool(plan.max_cards or plan.token_budget or plan.deadline_ms)
+
+
+class EarlyStop:
+    """Early termination of one document's generation, for max_cards and deadline_ms.
+
+    Chunks go out most informative first, and only while the cards kept so far plus about
+    CARDS_PER_CHUNK for every chunk still in flight fall short of max_cards, so a short quiz from a
+    long document costs about as many calls as it needs. Generation stops, cancelling the calls still
+    pending, once max_cards cards are kept or the deadline passes. The consumer reports the cards it
+    keeps, after deduplication, with keep().
+    """
+
+    def __init__(self, plan: GenerationPlan):
+        self.max_cards = plan.max_cards
+        self.deadline = time.perf_counter() + plan.deadline_ms / 1000 if plan.deadline_ms else None
+        self.kept = 0
+        self.in_flight = 0
+        # Chunks picked for generation, or None until selection has finished
+        self.selected = None
+        self.received = 0
+        self.reason = None
+        self.changed = asyncio.Event()
+
+    # The next item from the queue, or None once the deadline has passed. Items already queued are still taken.
+    async def get(self, queue: asyncio.Queue):
+        if self.deadline is None or not queue.empty():
+            return await queue.get()
+        try:
+            return await asyncio.wait_for(queue.get(), max(self.deadline - time.perf_counter(), 0))
+        except asyncio.TimeoutError:
+            return None
+
+    def has_room(self) -> bool:
+        return not self.max_cards or self.kept + self.in_flight * CARDS_PER_CHUNK < self.max_cards
+
+    async def wait_for_room(self):
+        while not self.has_room():
+            self.changed.clear()
+            await self.changed.wait()
+
+    def dispatched(self, chunks: int):
+        self.in_flight += chunks
+
+    def settled(self):
+        self.in_flight -= 1
+        self.received += 1
+        self.changed.set()
+
+    def keep(self, cards: int):
+        self.kept += cards
+        self.changed.set()
+
+    def reached(self) -> bool:
+        return bool(self.max_cards) and self.kept >= self.max_cards
+
+    def stop(self, reason: str):
+        self.reason = reason
+        EARLY_STOPS.labels(reason).inc()
+
+    # How generation ended early, for the response: why, and how many selected chunks were never generated
+    # (None when the deadline passed before selection finished, so the number is unknown)
+    def summary(self) -> Optional[dict]:
+        if self.reason is None:
+            return None
+        skipped = self.selected - self.received if self.selected is not None else None
+        return {"reason": self.reason, "skipped_chunks": skipped}
+
+def make_early_stop(plan: GenerationPlan) -> Optional[EarlyStop]:
+    return EarlyStop(plan) if plan.max_cards or plan.deadline_ms else None
+
+# Non-empty chunks with their position in the document
+async def indexed_chunks(chunks):
+    index = 0
+    async for chunk in chunks:
+        if chunk.strip():
+            yield index, chunk
+        index += 1
+
+# Count tokens and pick chunks within the budget (see select_chunks), off the event loop
+def select_budgeted(texts: list, max_chunks: int, token_budget: int) -> tuple:
+    return select_chunks(texts, [count_tokens(text) for text in texts], max_chunks, token_budget)
+
+# Chunks to generate, with their position and salience. Without a budget every chunk goes out as soon
+# as it is split, with no salience. With one, the whole document is split first and only the most
+# informative chunks that fit max_cards (at about CARDS_PER_CHUNK cards each, with SELECTION_RESERVE
+# spares) and token_budget (chunk tokens) go out, most informative first.
+async def budgeted_chunks(chunks, plan: GenerationPlan, early_stop: Optional[EarlyStop] = None):
+    if not budgeted(plan):
+        async for index, chunk in indexed_chunks(chunks):
+            yield index, chunk, None
+        return
+    candidates = [item async for item in indexed_chunks(chunks)]
+    started = time.perf_counter()
+    texts = [chunk for _, chunk in candidates]
+    max_chunks = math.ceil(plan.max_cards / CARDS_PER_CHUNK * SELECTION_RESERVE) if plan.max_cards else 0
+    # Scoring and greedy picking take seconds for books of thousands of chunks, so they run in a thread
+    # to keep the event loop serving other requests
+    picked, salience = await asyncio.to_thread(select_budgeted, texts, max_chunks, plan.token_budget)
+    record_stage("select", time.perf_counter() - started)
+    logger.info("Selected %d of %d chunks within the budget", len(picked), len(candidates))
+    if early_stop is not None:
+        early_stop.selected = len(picked)
+    for position in picked:
+        index, chunk = candidates[position]
+        yield index, chunk, salience[position]
+
+# Fan out chunk generation concurrently as chunks arrive from the (async) chunk stream,
+# yielding a ChunkResult as each chunk finishes. Chunks with cached output finish immediately;
+# with packing enabled the rest are grouped into packs of up to plan.pack_tokens. Documents in
+# a batch pass one shared request_semaphore so they draw on the same concurrency limit.
+# Cards of a LocatedChunk get its location as their source, and cards of a chunk selected by salience
+# get its salience as their importance. With early_stop, chunks are held back while enough cards are
+# expected from those in flight, and the results end early (see EarlyStop).
+async def iter_chunk_results(chunks, plan: GenerationPlan, request_semaphore: Optional[asyncio.Semaphore] = None,
+                             early_stop: Optional[EarlyStop] = None):
+    request_semaphore = request_semaphore or asyncio.Semaphore(plan.concurrency)
+    finished = asyncio.Queue()
+    tasks = []
+    token_counts = {}
+    locations = {}
+    saliences = {}
+
+    async def run(index: int, chunk: str):
+        try:
+            generation = await generate_chunk_flashcards(plan, chunk, request_semaphore)
+            finished.put_nowait((index, generation.flashcards, False, None, token_counts[index], generation.attempts, generation.model))
+        except Exception as e:
+            logger.warning("Error generating flashcards for chunk %d: %s", index, e)
+            finished.put_nowait((index, [], False, e, token_counts[index], getattr(e, "attempts", 1), None))
+
+    async def run_pack(pack: list):
+        try:
+            results, attempts = await generate_packed_flashcards(plan, pack, request_semaphore)
+        except Exception as e:
+            logger.warning("Packed generation failed for chunks %s, retrying one chunk per call: %s", [index for index, _ in pack], e)
+            await asyncio.gather(*(run(index, chunk) for index, chunk in pack))
+            return
+        answered = [index for index, _ in pack if results[index]]
+        skipped = [(index, chunk) for index, chunk in pack if not results[index]]
+        # The pack's retries are counted once, on its first chunk; the others report the one call they shared
+        for number, index in enumerate(answered):
+            finished.put_nowait((index, results[index], False, None, token_counts[index], attempts if number == 0 else 1, MODEL_NAME))
+        if skipped:
+            logger.info("Packed response skipped chunks %s, retrying one chunk per call", [index for index, _ in skipped])
+            await asyncio.gather(*(run(index, chunk) for index, chunk in skipped))
+
+    def flush(pack: list):
+        if len(pack) == 1:
+            tasks.append(asyncio.create_task(run(*pack[0])))
+        elif pack:
+            tasks.append(asyncio.create_task(run_pack(pack)))
+
+    # Dispatch chunks as soon as they are chosen; None marks the end of the stream with the chunk count
+    async def dispatch():
+        try:
+            dispatched = 0
+            pack = []
+            pack_tokens = 0
+            async for index, chunk, salience in budgeted_chunks(chunks, plan, early_stop):
+                if early_stop is not None:
+                    if not early_stop.has_room():
+                        # Send the pack being filled before waiting, or the room might never come
+                        flush(pack)
+                        pack, pack_tokens = [], 0
+                        await early_stop.wait_for_room()
+                    early_stop.dispatched(1)
+                dispatched += 1
+                tokens = token_counts[index] = count_tokens(chunk)
+                if isinstance(chunk, LocatedChunk):
+                    locations[index] = chunk.location
+                if salience is not None:
+                    saliences[index] = salience
+                cached = chunk_cache.get(chunk_cache_key(plan, chunk))
+                if cached is not None:
+                    finished.put_nowait((index, cached["flashcards"], True, None, tokens, 0, None))
+                elif not plan.pack_tokens:
+                    flush([(index, chunk)])
+                else:
+                    if pack and pack_tokens + tokens > plan.pack_tokens:
+                        flush(pack)
+                        pack, pack_tokens = [], 0
+                    pack.append((index, chunk))
+                    pack_tokens += tokens
+            flush(pack)
+            finished.put_nowait((None, dispatched))
+        except Exception as e:
+            finished.put_nowait(e)
+
+    dispatcher = asyncio.create_task(dispatch())
+    total = None
+    received = 0
+    try:
+        while total is None or received < total:
+            if early_stop is not None and early_stop.reached():
+                early_stop.stop("max_cards")
+                break
+            item = await early_stop.get(finished) if early_stop is not None else await finished.get()
+            if item is None:
+                early_stop.stop("deadline")
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item[0] is None:
+                total = item[1]
+                continue
+            received += 1
+            if early_stop is not None:
+                early_stop.settled()
+            annotations = {}
+            if item[0] in saliences:
+                annotations["importance"] = round(saliences.pop(item[0]), 3)
+            if item[0] in locations:
+                annotations["source"] = locations.pop(item[0])
+            if annotations:
+                item = (item[0], [{**card, **annotations} for card in item[1]], *item[2:])
+            yield ChunkResult(*item, total)
+    finally:
+        # Stop extraction and any chunks still pending if the consumer goes away early
+        dispatcher.cancel()
+        for task in tasks:
+            task.cancel()
+
+# Status of a chunk for the response: reused, generated, failed, or rate_limited when it failed
+# because the provider's rate limit outlasted every retry
+def chunk_status(result: ChunkResult) -> str:
+    if result.error is not None:
+        return "rate_limited" if getattr(result.error, "rate_limited", False) else "failed"
+    return "reused" if result.reused else "generated"
+
+# Running totals of chunk outcomes for the response
+class ChunkTally:
+    def __init__(self):
+        self.results = {}
+        self.failed_chunks = []
+        self.statuses = {}
+        self.reused = 0
+        self.tokens = 0
+        self.sent_tokens = 0
+        self.retries = 0
+        self.escalated = 0
+
+    def add(self, result: ChunkResult):
+        self.tokens += result.tokens
+        if not result.reused:
+            self.sent_tokens += result.tokens
+        escalated = result.model is not None and result.model != MODEL_NAME
+        self.escalated += escalated
+        self.retries += max(result.attempts - 1 - escalated, 0)
+        status = chunk_status(result)
+        CHUNKS.labels(status).inc()
+        self.statuses[result.index] = {
+            "chunk": result.index, "status": status, "attempts": result.attempts, "model": result.model,
+        }
+        if result.error is not None:
+            self.failed_chunks.append({"chunk": result.index, "error": str(result.error)})
+            return
+        self.results[result.index] = result.flashcards
+        self.reused += result.reused
+
+    @property
+    def completed(self) -> int:
+        return len(self.results) + len(self.failed_chunks)
+
+    # Flashcards in chunk order
+    def flashcards(self) -> list:
+        return [card for index in sorted(self.results) for card in self.results[index]]
+
+    def sorted_failures(self) -> list:
+        return sorted(self.failed_chunks, key=lambda failure: failure["chunk"])
+
+    def sorted_statuses(self) -> list:
+        return [self.statuses[index] for index in sorted(self.statuses)]
+
+    def summary(self) -> dict:
+        return {
+            "total": self.completed,
+            "reused": self.reused,
+            "regenerated": len(self.results) - self.reused,
+            "tokens": self.tokens,
+            "tokens_sent": self.sent_tokens,
+            "retries": self.retries,
+            "escalated": self.escalated,
+        }
+
+def make_deduplicator(plan: GenerationPlan) -> Optional[Deduplicator]:
+    return Deduplicator(plan.dedup_threshold) if plan.dedup_threshold else None
+
+# With a budget the deck is ranked by importance, most important first, and cut to max_cards
+def rank_deck(flashcards: list, plan: GenerationPlan) -> list:
+    if not budgeted(plan):
+        return flashcards
+    ranked = rank_cards(flashcards)
+    return ranked[:plan.max_cards] if plan.max_cards else ranked
+
+def observe_document(plan: GenerationPlan, chunks: int, cards: int, filtered: dict):
+    CHUNKS_PER_REQUEST.observe(chunks)
+    CARDS_PER_REQUEST.labels(plan.type).observe(cards)
+    FILTERED_TOKENS.inc(filtered["tokens"])
+
+# What the content filter dropped from a document: lines, chunks and their tokens
+def filtered_summary(content_filter: Optional[BoilerplateFilter]) -> dict:
+    return content_filter.summary() if content_filter is not None else {"lines": 0, "chunks": 0, "tokens": 0}
+
+# Only complete decks are cached, so a transient chunk failure or a missed deadline is retried on the next upload
+def cacheable(result: dict) -> bool:
+    return not result["failed_chunks"] and (result.get("stopped") or {}).get("reason") != "deadline"
+
+# Generate flashcards for all chunks and re-assemble them in chunk order, keeping the first of any
+# near-duplicates (ranked by importance instead with a budget). With max_cards or deadline_ms,
+# duplicates are dropped as chunks finish instead, so generation can stop once enough distinct cards
+# are kept. content_filter is the filter the chunks passed through, if any, for reporting what it dropped.
+async def generate_flashcards(chunks, plan: GenerationPlan, request_semaphore: Optional[asyncio.Semaphore] = None,
+                              content_filter: Optional[BoilerplateFilter] = None) -> dict:
+    tally = ChunkTally()
+    deduplicator = make_deduplicator(plan)
+    early_stop = make_early_stop(plan)
+    async for result in iter_chunk_results(chunks, plan, request_semaphore, early_stop):
+        if early_stop is not None:
+            if deduplicator is not None and result.flashcards:
+                result = result._replace(flashcards=deduplicator.filter(result.flashcards))
+            early_stop.keep(len(result.flashcards))
+        tally.add(result)
+
+    flashcards = tally.flashcards()
+    if deduplicator is not None and early_stop is None:
+        flashcards = deduplicator.filter(flashcards)
+    flashcards = rank_deck(flashcards, plan)
+    filtered = filtered_summary(content_filter)
+    observe_document(plan, tally.completed, len(flashcards), filtered)
+    return {
+        "flashcards": flashcards,
+        "failed_chunks": tally.sorted_failures(),
+        "chunks": tally.summary(),
+        "chunk_status": tally.sorted_statuses(),
+        "duplicates_removed": deduplicator.dropped if deduplicator else 0,
+        "filtered": filtered,
+        "stopped": early_stop.summary() if early_stop else None,
+    }
+
+# Stream each chunk's flashcards as soon as they are produced, then a final summary event.
+# Near-duplicates of cards already sent are dropped as chunks finish, so the first to finish wins.
+# The assembled deck is stored in the result cache once every chunk has succeeded. Headers are sent
+# before any work is done, so the timing breakdown goes in the final event instead. With max_cards,
+# no more than that many cards are streamed, and the stream ends as soon as they are sent.
+async def stream_flashcards(chunks, plan: GenerationPlan, cache_key: str, content_filter: Optional[BoilerplateFilter] = None):
+    timings = current_timings.get()
+    tally = ChunkTally()
+    deduplicator = make_deduplicator(plan)
+    early_stop = make_early_stop(plan)
+    sent = 0
+    try:
+        async for result in iter_chunk_results(chunks, plan, early_stop=early_stop):
+            if deduplicator is not None and result.flashcards:
+                result = result._replace(flashcards=deduplicator.filter(result.flashcards))
+            if plan.max_cards:
+                result = result._replace(flashcards=result.flashcards[:max(plan.max_cards - sent, 0)])
+                sent += len(result.flashcards)
+            if early_stop is not None:
+                early_stop.keep(len(result.flashcards))
+            tally.add(result)
+            if result.error is not None:
+                yield {
+                    "event": "error",
+                    "chunk": result.index,
+                    "error": str(result.error),
+                    "status": chunk_status(result),
+                    "attempts": result.attempts,
+                    "completed": tally.completed,
+                    "total": result.total,
+                }
+                continue
+            yield {
+                "event": "chunk",
+                "chunk": result.index,
+                "flashcards": result.flashcards,
+                "reused": result.reused,
+                "attempts": result.attempts,
+                "model": result.model,
+                "completed": tally.completed,
+                "total": result.total,
+            }
+    except Exception as e:
+        # Headers are already sent, so a failed extraction is reported in-band
+        logger.exception("Flashcard stream failed")
+        yield {"event": "failed", "error": str(e)}
+        return
+
+    failed_chunks = tally.sorted_failures()
+    summary = tally.summary()
+    statuses = tally.sorted_statuses()
+    duplicates_removed = deduplicator.dropped if deduplicator else 0
+    flashcards = rank_deck(tally.flashcards(), plan)
+    filtered = filtered_summary(content_filter)
+    stopped = early_stop.summary() if early_stop else None
+    observe_document(plan, tally.completed, len(flashcards), filtered)
+    result = {
+        "flashcards": flashcards, "failed_chunks": failed_chunks, "chunks": summary, "chunk_status": statuses,
+        "duplicates_removed": duplicates_removed, "filtered": filtered, "stopped": stopped,
+    }
+    if cacheable(result):
+        result_cache.put(cache_key, result)
+    done = {
+        "event": "done", "failed_chunks": failed_chunks, "chunks": summary, "chunk_status": statuses,
+        "duplicates_removed": duplicates_removed, "filtered": filtered, "stopped": stopped, "cached": False,
+    }
+    if timings is not None:
+        done["timings"] = timings.summary()
+        REQUEST_SECONDS.labels("flashcard_stream").observe(timings.total())
+    yield done
+
+# Summary for a document served from the result cache: every chunk reused, nothing sent
+def cached_summary(cached: dict) -> dict:
+    summary = cached.get("chunks", {})
+    total = summary.get("total", 0)
+    return {"total": total, "reused": total, "regenerated": 0, "tokens": summary.get("tokens", 0), "tokens_sent": 0, "retries": 0, "escalated": 0}
+
+def cached_statuses(cached: dict) -> list:
+    return [{"chunk": status["chunk"], "status": "reused", "attempts": 0, "model": None} for status in cached.get("chunk_status", [])]
+
+# Buffered response for a document served from the result cache
+def cached_result(cached: dict) -> dict:
+    return {**cached, "chunks": cached_summary(cached), "chunk_status": cached_statuses(cached), "cached": True}
+
+# Serialize stream events as NDJSON lines or Server-Sent Events
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+async def encode_stream(events, stream: str):
+    async for event in events:
+        if stream == "sse":
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        else:
+            yield json.dumps(event) + "\n"
+
+# Disconnects: a client that goes away (a closed tab, a dropped connection) must not leave its
+# document's LLM calls and extraction running. Once the body has been read, the next message the
+# server delivers for the request is its disconnect.
+async def wait_for_disconnect(request: Request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+# Status of a response nobody is left to read, after nginx's "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+# Await a coroutine in a task of its own while watching for the client to disconnect. On a disconnect
+# the task is cancelled, which cancels its pending LLM calls and queued extraction, and None is returned.
+async def cancel_on_disconnect(request: Request, work, endpoint: str):
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if task.cancelled():
+        CLIENT_DISCONNECTS.labels(endpoint).inc()
+        logger.info("Client disconnected from %s; generation cancelled", endpoint)
+        return None
+    return task.result()
+
+# Pass a stream's events through, producing each one in a task of its own while watching for the
+# client to disconnect. On a disconnect the pending step is cancelled, which unwinds the event
+# generators and with them the document's pending LLM calls and queued extraction. The server may
+# notice the disconnect first and close the stream itself; either way the stream ends unfinished.
+async def stream_until_disconnected(request: Request, events, endpoint: str):
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    step = None
+    finished = False
+    try:
+        while True:
+            step = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                return
+            try:
+                event = step.result()
+            except StopAsyncIteration:
+                finished = True
+                return
+            except Exception:
+                finished = True
+                raise
+            yield event
+    finally:
+        watcher.cancel()
+        if not finished:
+            CLIENT_DISCONNECTS.labels(endpoint).inc()
+            logger.info("Client disconnected from %s; generation cancelled", endpoint)
+        if step is not None and not step.done():
+            step.cancel()
+            await asyncio.gather(step, return_exceptions=True)
+        await events.aclose()
+
+def streaming_response(events, stream: str) -> StreamingResponse:
+    return StreamingResponse(
+        encode_stream(events, stream),
+        media_type=STREAM_MEDIA_TYPES[stream],
+        # Keep reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def cached_events(cached: dict):
+    yield {"event": "cached", "flashcards": cached["flashcards"]}
+    yield {
+        "event": "done", "failed_chunks": [], "chunks": cached_summary(cached), "chunk_status": cached_statuses(cached),
+        "duplicates_removed": cached.get("duplicates_removed", 0), "filtered": cached.get("filtered", filtered_summary(None)),
+        "stopped": cached.get("stopped"), "cached": True,
+    }
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the flashcard generation prototype!"}
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {"results": result_cache.stats(), "chunks": chunk_cache.stats(), "transcripts": transcript_cache.stats()}
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return llm_scheduler.stats()
+
+@app.get("/models/stats")
+def model_stats():
+    return escalation_stats.snapshot()
+
+register_stats({"results": result_cache, "chunks": chunk_cache, "transcripts": transcript_cache}, llm_scheduler, escalation_stats, lambda: pending_extractions)
+
+# Prometheus metrics for this process
+@app.get("/metrics")
+def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Buffered responses carry a Server-Timing header breaking the request down by stage
 @app.post("/flashcard/")
 async def create_flashcards(
+    request: Request,
+    response: Response,
     type: str = Form(...),
     method: str = Form(...),
     text: Optional[str] = Form(None),
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    concurrency: Optional[int] = Form(None),
+    stream: Optional[str] = Form(None),
+    pack_tokens: Optional[int] = Form(None),
+    chunk_tokens: Optional[int] = Form(None),
+    overlap_tokens: Optional[int] = Form(None),
+    dedup_threshold: Optional[float] = Form(None),
+    max_cards: Optional[int] = Form(None),
+    token_budget: Optional[int] = Form(None),
+    sample_rows: Optional[int] = Form(None),
+    deadline_ms: Optional[int] = Form(None)
 ):
-    all_flashcards = []
-
-    # Extraction and splitting based on the method
-    if method == "pdf":
-        if not file or not file.filename.endswith(".pdf"):
-            raise HTTPException(status_code=400, detail="Please upload a valid PDF file.")
-        extracted_text = extract_text_from_pdf(file.file)
-    elif method == "pptx":
-        if not file or not file.filename.endswith(".pptx"):
-            raise HTTPException(status_code=400, detail="Please upload a valid PPTX file.")
-        extracted_text = extract_text_from_pptx(file.file)
-    elif method == "docx":
-        if not file or not file.filename.endswith(".docx"):
-            raise HTTPException(status_code=400, detail="Please upload a valid DOCX file.")
-        extracted_text = extract_text_from_docx(file.file)
-    elif method == "csv":
-        if not file or not file.filename.endswith(".csv"):
-            raise HTTPException(status_code=400, detail="Please upload a valid CSV file.")
-        extracted_text = extract_text_from_csv(file.file)
-    elif method == "text":
-        if not text:
-            raise HTTPException(status_code=400, detail="Please provide valid text input.")
-        extracted_text = text
-    else:
-        raise HTTPException(status_code=400, detail="Invalid method specified.")
-
-    # Split the document into manageable chunks
-    chunks = RecursiveCharacterTextSplitter(chunk_size=750, chunk_overlap=100).split_text(extracted_text)
-
-    # Select the appropriate prompt based on the flashcard type
-    if type == "type-I":
-        structured_llm = llm.with_structured_output(FlashcardSet)
-        prompt = normal_prompt
-    elif type == "type-II":
-        structured_llm = llm.with_structured_output(ClozeDeletionFlashcardSet)
-        prompt = cloze_prompt
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid stream format specified.")
+
+    timings = start_timings()
+    plan = make_plan(
+        type, concurrency, pack_tokens, chunk_tokens, overlap_tokens, dedup_threshold, max_cards, token_budget, sample_rows,
+        deadline_ms,
+    )
+    upload = await read_input(method, text, file)
+    reservation = None
+    try:
+        # Serve repeated uploads straight from the result cache
+        cache_key = result_cache_key(method, upload, plan)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            if stream:
+                return streaming_response(cached_events(cached), stream)
+            response.headers["Server-Timing"] = timings.header()
+            REQUEST_SECONDS.labels("flashcard").observe(timings.total())
+            return cached_result(cached)
+
+        if method in EXTRACTORS:
+            reservation = ensure_extraction_capacity()
+        if method == "youtube":
+            await load_transcript(upload.text())
+        content_filter = make_content_filter(method)
+        chunks = extract_chunks(method, upload, plan, content_filter, reservation=reservation)
+
+        # Generate flashcards for the extracted chunks. A streamed response owns the upload and the
+        # extraction reservation from here on.
+        if stream:
+            events = closing(stream_flashcards(chunks, plan, cache_key, content_filter), upload, reservation)
+            upload = reservation = None
+            return streaming_response(stream_until_disconnected(request, events, "flashcard"), stream)
+        result = await cancel_on_disconnect(
+            request, generate_flashcards(chunks, plan, content_filter=content_filter), "flashcard",
+        )
+    finally:
+        # Extraction closes the reservation itself, unless it never started
+        if upload is not None:
+            upload.close()
+        if reservation is not None:
+            reservation.close()
+    if result is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+    if cacheable(result):
+        result_cache.put(cache_key, result)
+
+    response.headers["Server-Timing"] = timings.header()
+    REQUEST_SECONDS.labels("flashcard").observe(timings.total())
+    return {**result, "cached": False}
+
+# Close what a stream holds (its spooled upload, its extraction reservation) once its events are finished or abandoned
+async def closing(events, *resources):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        for resource in resources:
+            if resource is not None:
+                resource.close()
+
+# Input method of an uploaded file, from its extension; .txt files are read as text
+def file_method(filename: str) -> str:
+    method = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if method == "txt":
+        return "text"
+    if method not in EXTRACTORS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
+    return method
+
+# Hold an extraction slot while the document is being extracted, but not while its chunks are generated
+async def hold_slot(pieces, slots: asyncio.Semaphore):
+    async with slots:
+        async for piece in pieces:
+            yield piece
+
+# Generate one document of a batch. A failed document is reported in its entry without failing the batch.
+async def generate_document(name: str, method: str, upload: Upload, plan: GenerationPlan,
+                            request_semaphore: asyncio.Semaphore, extraction_slots: asyncio.Semaphore,
+                            reservation: Optional[ExtractionReservation] = None) -> dict:
+    started = time.perf_counter()
+    cache_key = result_cache_key(method, upload, plan)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        result = cached_result(cached)
     else:
-        raise HTTPException(status_code=400, detail="Invalid type specified.")
+        try:
+            content_filter = make_content_filter(method)
+            chunks = extract_chunks(method, upload, plan, content_filter, extraction_slots, reservation)
+            result = await generate_flashcards(chunks, plan, request_semaphore, content_filter)
+        except Exception as e:
+            logger.exception("Batch document %s failed", name)
+            return {"name": name, "method": method, "error": str(e), "seconds": round(time.perf_counter() - started, 3)}
+        if cacheable(result):
+            result_cache.put(cache_key, result)
+        result = {**result, "cached": False}
+    return {"name": name, "method": method, **result, "seconds": round(time.perf_counter() - started, 3)}
 
-    # Generate flashcards for the extracted chunks
-    for chunk in chunks:
-        if chunk.strip():
-            try:
-                response = structured_llm.invoke(prompt.format(chunk=chunk))
-                if 'flashcards' in response:
-                    all_flashcards.extend(response['flashcards'])
-            except Exception as e:
-                print(f"Error generating flashcards for chunk")
+@app.post("/batch")
+async def create_batch(
+    request: Request,
+    response: Response,
+    type: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    texts: Optional[List[str]] = Form(None),
+    concurrency: Optional[int] = Form(None),
+    pack_tokens: Optional[int] = Form(None),
+    chunk_tokens: Optional[int] = Form(None),
+    overlap_tokens: Optional[int] = Form(None),
+    dedup_threshold: Optional[float] = Form(None),
+    max_cards: Optional[int] = Form(None),
+    token_budget: Optional[int] = Form(None),
+    sample_rows: Optional[int] = Form(None),
+    deadline_ms: Optional[int] = Form(None)
+):
+    plan = make_plan(
+        type, concurrency or DEFAULT_BATCH_CONCURRENCY, pack_tokens, chunk_tokens, overlap_tokens, dedup_threshold,
+        max_cards, token_budget, sample_rows, deadline_ms,
+    )
+    files = [file for file in files or [] if file.filename]
+    texts = [text for text in texts or [] if text.strip()]
+    if not files and not texts:
+        raise HTTPException(status_code=400, detail="Please upload at least one file or provide text input.")
+    if len(files) + len(texts) > BATCH_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_DOCUMENTS} documents.")
+
+    methods = [file_method(file.filename) for file in files]
+    documents = []
+    reservation = None
+    try:
+        # Files are spooled one at a time, stopping as soon as they pass the batch limit
+        total = 0
+        for file, method in zip(files, methods):
+            upload = await spool_upload(file, MAX_UPLOAD_BYTES)
+            documents.append((file.filename, method, upload))
+            total += upload.size
+            if MAX_BATCH_UPLOAD_BYTES and total > MAX_BATCH_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"The files of a batch may total at most {MAX_BATCH_UPLOAD_BYTES} bytes.")
+        documents += [(f"text-{number}", "text", Upload.from_bytes(text.encode("utf-8"))) for number, text in enumerate(texts, 1)]
+        # The batch's reservation counts its first file until it is extracted; the other files count
+        # themselves once their extraction starts
+        if files:
+            reservation = ensure_extraction_capacity()
+
+        # All documents share one concurrency limit for their LLM calls, and extract at most as many
+        # files at once as there are extraction workers so a batch can't fill the extraction queue alone
+        timings = start_timings()
+        started = time.perf_counter()
+        request_semaphore = asyncio.Semaphore(plan.concurrency)
+        extraction_slots = asyncio.Semaphore(EXTRACTION_WORKERS)
+        results = await cancel_on_disconnect(request, asyncio.gather(*(
+            generate_document(name, method, upload, plan, request_semaphore, extraction_slots, reservation if number == 0 else None)
+            for number, (name, method, upload) in enumerate(documents)
+        )), "batch")
+    finally:
+        for _, _, upload in documents:
+            upload.close()
+        if reservation is not None:
+            reservation.close()
+    if results is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    seconds = time.perf_counter() - started
+    response.headers["Server-Timing"] = timings.header()
+    REQUEST_SECONDS.labels("batch").observe(seconds)
+
+    chunks = sum(result.get("chunks", {}).get("total", 0) for result in results)
+    return {
+        "documents": results,
+        "totals": {
+            "documents": len(results),
+            "failed_documents": sum("error" in result for result in results),
+            "flashcards": sum(len(result.get("flashcards", [])) for result in results),
+            "chunks": chunks,
+            "failed_chunks": sum(len(result.get("failed_chunks", [])) for result in results),
+            "cached_documents": sum(result.get("cached", False) for result in results),
+        },
+        "timing": {
+            "seconds": round(seconds, 3),
+            "document_seconds": round(sum(result["seconds"] for result in results), 3),
+            "chunks_per_second": round(chunks / seconds, 2) if seconds else None,
+            "stages": timings.summary(),
+        },
+    }
+
+# Run a background job, yielding the same events as a streamed /flashcard/ request
+async def run_job(params: dict, upload: Upload):
+    plan = make_plan(
+        params["type"], params.get("concurrency"), params.get("pack_tokens"),
+        params.get("chunk_tokens"), params.get("overlap_tokens"), params.get("dedup_threshold"),
+        params.get("max_cards"), params.get("token_budget"), params.get("sample_rows"), params.get("deadline_ms"),
+    )
+    cache_key = result_cache_key(params["method"], upload, plan)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        async for event in cached_events(cached):
+            yield event
+        return
+
+    start_timings()
+    content_filter = make_content_filter(params["method"])
+    chunks = extract_chunks(params["method"], upload, plan, content_filter)
+    async for event in stream_flashcards(chunks, plan, cache_key, content_filter):
+        yield event
+
+job_manager = JobManager(JobStore(JOB_STORE_PATH), run_job, JOB_WORKERS, os.path.join(DATA_DIR, "job_inputs"))
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    type: str = Form(...),
+    method: str = Form(...),
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    concurrency: Optional[int] = Form(None),
+    pack_tokens: Optional[int] = Form(None),
+    chunk_tokens: Optional[int] = Form(None),
+    overlap_tokens: Optional[int] = Form(None),
+    dedup_threshold: Optional[float] = Form(None),
+    max_cards: Optional[int] = Form(None),
+    token_budget: Optional[int] = Form(None),
+    sample_rows: Optional[int] = Form(None),
+    deadline_ms: Optional[int] = Form(None)
+):
+    params = {
+        "type": type,
+        "method": method,
+        "concurrency": concurrency,
+        "pack_tokens": pack_tokens,
+        "chunk_tokens": chunk_tokens,
+        "overlap_tokens": overlap_tokens,
+        "dedup_threshold": dedup_threshold,
+        "max_cards": max_cards,
+        "token_budget": token_budget,
+        "sample_rows": sample_rows,
+        "deadline_ms": deadline_ms,
+    }
+    make_plan(
+        type, concurrency, pack_tokens, chunk_tokens, overlap_tokens, dedup_threshold, max_cards, token_budget, sample_rows,
+        deadline_ms,
+    )
+    upload = await read_input(method, text, file)
+    try:
+        job_id = job_manager.submit(params, upload)
+    finally:
+        upload.close()
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
-    return {"flashcards": all_flashcards}
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,140 @@
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Latency buckets in seconds, from a cached lookup up to a long document
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+EXTRACTION_SECONDS = Histogram(
+    "flashygen_extraction_seconds", "Time spent extracting the text of one document", ["method"], buckets=SECONDS_BUCKETS,
+)
+SPLIT_SECONDS = Histogram(
+    "flashygen_split_seconds", "Time spent splitting one document's text into chunks", buckets=SECONDS_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "flashygen_llm_call_seconds", "Latency of one LLM call attempt", ["model", "type"], buckets=SECONDS_BUCKETS,
+)
+LLM_WAIT_SECONDS = Histogram(
+    "flashygen_llm_wait_seconds", "Time a chunk waited for concurrency slots, rate limits and retry backoff",
+    ["model"], buckets=SECONDS_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "flashygen_request_seconds", "Time to serve one generation request", ["endpoint"], buckets=SECONDS_BUCKETS,
+)
+CHUNKS_PER_REQUEST = Histogram(
+    "flashygen_chunks_per_request", "Non-empty chunks in one document", buckets=COUNT_BUCKETS,
+)
+CARDS_PER_REQUEST = Histogram(
+    "flashygen_cards_per_request", "Flashcards returned for one document", ["type"], buckets=COUNT_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "flashygen_startup_seconds", "Time the server took to start: importing the app, then the optional warm-up", ["phase"],
+)
+CHUNKS = Counter("flashygen_chunks", "Chunks processed, by outcome", ["status"])
+PROMPT_TOKENS = Counter("flashygen_prompt_tokens", "Prompt tokens sent to the LLM", ["model"])
+COMPLETION_TOKENS = Counter("flashygen_completion_tokens", "Completion tokens generated by the LLM", ["model"])
+FILTERED_TOKENS = Counter("flashygen_filtered_tokens", "Tokens of boilerplate and low-information text dropped before generation")
+EARLY_STOPS = Counter("flashygen_early_stops", "Requests that stopped generating before every selected chunk was done", ["reason"])
+CANCELLED_CALLS = Counter(
+    "flashygen_cancelled_llm_calls",
+    "LLM calls cancelled before they returned: queued ones were never sent, sent ones were cut off mid-call or between retries",
+    ["model", "stage"],
+)
+CLIENT_DISCONNECTS = Counter(
+    "flashygen_client_disconnects", "Requests whose client went away before the response was complete", ["endpoint"],
+)
+
+
+class RequestTimings:
+    """Seconds spent in each stage while serving one request.
+
+    Stages overlap (chunks are generated while later pages are still being extracted, and LLM calls
+    run concurrently), so the stages can add up to more than the total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] += seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict:
+        return {**{stage: round(seconds, 3) for stage, seconds in self.stages.items()}, "total": round(self.total(), 3)}
+
+    # Server-Timing header value, in milliseconds, so browser dev tools show the breakdown
+    def header(self) -> str:
+        stages = {**self.stages, "total": self.total()}
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items())
+
+# Timings of the request being served; tasks spawned by the request inherit it
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def start_timings() -> RequestTimings:
+    timings = RequestTimings()
+    current_timings.set(timings)
+    return timings
+
+# Add time spent in a stage to the current request's timings, if any (background jobs have none)
+def record_stage(stage: str, seconds: float):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+class StatsCollector:
+    """Exposes the counters the caches, the scheduler and the escalation tracker already keep, read at scrape time."""
+
+    def __init__(self, caches: dict, scheduler, escalation_stats, pending_extractions):
+        self.caches = caches
+        self.scheduler = scheduler
+        self.escalation_stats = escalation_stats
+        # Callable returning the number of extractions running or queued
+        self.pending_extractions = pending_extractions
+
+    def collect(self):
+        hits = CounterMetricFamily("flashygen_cache_hits", "Cache hits", labels=["cache", "tier"])
+        misses = CounterMetricFamily("flashygen_cache_misses", "Cache misses", labels=["cache"])
+        size = GaugeMetricFamily("flashygen_cache_bytes", "Bytes held by the cache", labels=["cache", "tier"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name, "memory"], stats["memory_hits"])
+            hits.add_metric([name, "disk"], stats["disk_hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name, "memory"], stats["memory_bytes"])
+            size.add_metric([name, "disk"], stats["disk_bytes"])
+        yield from (hits, misses, size)
+
+        families = {
+            name: CounterMetricFamily(f"flashygen_llm_{name}", description, labels=["model"])
+            for name, description in (
+                ("calls", "LLM call attempts"),
+                ("retries", "LLM calls retried after a rate limit, server or connection error"),
+                ("rate_limited", "LLM calls answered with a 429"),
+                ("failed", "LLM calls that failed for good"),
+                ("rate_limit_wait_seconds", "Time calls waited for the model's request and token budgets"),
+            )
+        }
+        for model, stats in self.scheduler.stats().items():
+            for name in ("calls", "retries", "rate_limited", "failed"):
+                families[name].add_metric([model], stats[name])
+            families["rate_limit_wait_seconds"].add_metric([model], stats["waited_seconds"])
+        yield from families.values()
+
+        snapshot = self.escalation_stats.snapshot()
+        escalations = CounterMetricFamily("flashygen_escalations", "Chunks escalated to a larger model", labels=["reason"])
+        for reason, count in snapshot["reasons"].items():
+            escalations.add_metric([reason], count)
+        yield escalations
+
+        yield GaugeMetricFamily("flashygen_pending_extractions", "Extractions running or queued", value=self.pending_extractions())
+
+def register_stats(caches: dict, scheduler, escalation_stats, pending_extractions):
+    REGISTRY.register(StatsCollector(caches, scheduler, escalation_stats, pending_extractions))
@@ -0,0 +1,107 @@
+import math
+import re
+import numpy as np
+from dedup import card_text
+
+# Words of three or more letters, lowercased; digits and single letters carry little meaning on their own
+_TERM_PATTERN = re.compile(r"[a-z][a-z'-]{2,}")
+STOPWORDS = frozenset("""
+about above after again against all also and any are because been before being below between both but
+can could did does doing down during each few for from further had has have having her here hers him his
+how into its itself just more most not now off once only other our ours out over own same she should
+some such than that the their theirs them then there these they this those through too under until very
+was were what when where which while who whom why will with would you your yours
+""".split())
+
+# Lowercased words of a text that carry meaning
+def content_terms(text: str) -> list:
+    return [term for term in _TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+# Share of a term's weight left once a selected chunk covers it, so later picks favour material not yet covered
+COVERAGE_DECAY = 0.5
+
+
+class TermMatrix:
+    """Sparse term counts of a list of texts, as parallel arrays of (row, term, count) entries."""
+
+    def __init__(self, texts: list):
+        vocabulary = {}
+        rows, terms = [], []
+        for row, text in enumerate(texts):
+            for term in content_terms(text):
+                rows.append(row)
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+        self.size = len(texts)
+        self.vocabulary_size = len(vocabulary)
+        # Collapse repeated (row, term) pairs into one entry with its count
+        pairs = np.array(rows, dtype=np.int64) * max(self.vocabulary_size, 1) + np.array(terms, dtype=np.int64)
+        unique, counts = np.unique(pairs, return_counts=True)
+        self.rows = unique // max(self.vocabulary_size, 1)
+        self.terms = unique % max(self.vocabulary_size, 1)
+        self.counts = counts.astype(np.float64)
+        self.lengths = np.bincount(self.rows, weights=self.counts, minlength=self.size)
+
+    # Weight of each term within this corpus: rare across rows (idf) but frequent overall (log count),
+    # the profile of the document's key concepts
+    def term_weights(self) -> np.ndarray:
+        document_frequency = np.bincount(self.terms, minlength=self.vocabulary_size)
+        total = np.bincount(self.terms, weights=self.counts, minlength=self.vocabulary_size)
+        idf = np.log((1 + self.size) / (1 + document_frequency)) + 1
+        return idf * np.log1p(total)
+
+    # Score of every row: the density of weighted terms, damped for rows much shorter than the median
+    # so fragments with a couple of keywords don't outrank full passages
+    def scores(self, weights: np.ndarray) -> np.ndarray:
+        totals = np.bincount(self.rows, weights=self.counts * weights[self.terms], minlength=self.size)
+        lengths = np.maximum(self.lengths, 1)
+        median = max(float(np.median(self.lengths)), 1.0) if self.size else 1.0
+        return totals / lengths * np.minimum(lengths / median, 1.0)
+
+# Pick the most informative chunks within the limits: at most max_chunks chunks (0 for no limit) of
+# at most token_budget tokens in total (0 for no limit). Chunks are picked greedily by score, and
+# the terms of every pick lose weight, so the selection covers the document's key material instead
+# of repeating its densest topic. Returns the picked indices in the order they were picked, most
+# informative first, and the salience of every chunk, scaled to 0-1. With neither limit every chunk
+# is picked, simply by salience.
+def select_chunks(texts: list, tokens: list, max_chunks: int, token_budget: int) -> tuple:
+    matrix = TermMatrix(texts)
+    weights = matrix.term_weights()
+    initial = matrix.scores(weights)
+    salience = initial / initial.max() if len(initial) and initial.max() > 0 else np.zeros(len(texts))
+    if not max_chunks and not token_budget:
+        return np.argsort(-initial, kind="stable").tolist(), salience.tolist()
+
+    tokens = np.asarray(tokens, dtype=np.int64)
+    available = np.ones(len(texts), dtype=bool)
+    picked = []
+    budget = token_budget or math.inf
+    scores = initial
+    while available.any() and (not max_chunks or len(picked) < max_chunks):
+        available &= tokens <= budget
+        if not available.any():
+            break
+        index = int(np.argmax(np.where(available, scores, -np.inf)))
+        picked.append(index)
+        available[index] = False
+        budget -= tokens[index]
+        covered = matrix.terms[matrix.rows == index]
+        weights[covered] *= COVERAGE_DECAY
+        scores = matrix.scores(weights)
+    return picked, salience.tolist()
+
+# Rank cards by importance, most important first. A card's importance is the salience of the chunk
+# it came from (its "importance" field) weighted by how much of the deck's key vocabulary the card
+# itself covers, so within a chunk the cards on central concepts come first.
+def rank_cards(cards: list) -> list:
+    if not cards:
+        return cards
+    matrix = TermMatrix([card_text(card) for card in cards])
+    scores = matrix.scores(matrix.term_weights()) if matrix.vocabulary_size else np.zeros(len(cards))
+    if scores.max() > 0:
+        scores = scores / scores.max()
+    ranked = [
+        {**card, "importance": round(card.get("importance", 1.0) * (0.5 + 0.5 * float(score)), 3)}
+        for card, score in zip(cards, scores)
+    ]
+    ranked.sort(key=lambda card: card["importance"], reverse=True)
+    return ranked
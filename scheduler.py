@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Budget refilled continuously at `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    # Seconds until `amount` units are available. A call larger than the whole budget waits for a
+    # full bucket instead of forever.
+    def wait_time(self, amount: float, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(min(amount, self.capacity) - self.level, 0) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class ModelLimiter:
+    """Requests-per-minute and tokens-per-minute budgets of one model. Waiting calls are served in order."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.lock = asyncio.Lock()
+        # Set when the provider reports a rate limit, so queued calls hold off until Retry-After passes
+        self.paused_until = 0.0
+        self.waited = 0.0
+
+    async def acquire(self, tokens: int):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                self.waited += wait
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+    # The provider says the budget is spent, whatever our estimate was: hold off, then resume at the
+    # steady rate instead of bursting
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.level = min(bucket.level, 0)
+
+
+class LLMCallError(Exception):
+    """An LLM call that failed for good, after `attempts` tries.
+
+    `transient` is set when the last failure was a rate limit, server or connection error rather
+    than a problem with the request or the model's output.
+    """
+
+    def __init__(self, error: Exception, attempts: int):
+        super().__init__(str(error))
+        self.attempts = attempts
+        self.rate_limited = status_code(error) == 429
+        self.transient = is_retryable(error)
+
+
+def status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+# Rate limits, server errors and dropped connections are worth retrying; anything else (bad requests,
+# unparseable output) would fail the same way again
+def is_retryable(error: Exception) -> bool:
+    status = status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Imported here since the Groq client is only loaded once the first LLM call is made
+    from groq import APIConnectionError
+    return isinstance(error, (APIConnectionError, ConnectionError, asyncio.TimeoutError))
+
+# Seconds from the error's Retry-After header, if the provider sent one
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMScheduler:
+    """Process-wide gate for LLM calls.
+
+    Each call waits until its model's request and token budgets allow it, rather than being fired
+    into a 429. Retryable failures are retried with jittered exponential backoff; a 429 pauses the
+    whole model for its Retry-After so queued calls don't hit the same limit.
+    """
+
+    def __init__(self, limits: dict, default_limit: tuple, max_retries: int, base_delay: float, max_delay: float):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiters = {}
+        self.counters = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self.limiters:
+            self.limiters[model] = ModelLimiter(*self.limits.get(model, self.default_limit))
+            self.counters[model] = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+        return self.limiters[model]
+
+    # Run `invoke()` (a coroutine factory) once the budgets allow `tokens` more tokens for `model`.
+    # Returns the result and the number of attempts it took; raises LLMCallError once retries run out.
+    async def call(self, model: str, tokens: int, invoke) -> tuple:
+        limiter = self.limiter(model)
+        counters = self.counters[model]
+        attempt = 0
+        while True:
+            await limiter.acquire(tokens)
+            attempt += 1
+            counters["calls"] += 1
+            try:
+                return await invoke(), attempt
+            except Exception as e:
+                if status_code(e) == 429:
+                    counters["rate_limited"] += 1
+                if not is_retryable(e) or attempt > self.max_retries:
+                    counters["failed"] += 1
+                    raise LLMCallError(e, attempt) from e
+                # Full jitter keeps retries from many chunks from arriving together
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                wait = retry_after(e)
+                if wait is not None:
+                    # acquire() holds this and every other queued call until the pause is over
+                    limiter.pause(wait)
+                counters["retries"] += 1
+                logger.info("Retrying %s call in %.1fs after attempt %d failed: %s", model, max(delay, wait or 0), attempt, e)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            model: {**self.counters[model], "waited_seconds": round(limiter.waited, 3)}
+            for model, limiter in self.limiters.items()
+        }
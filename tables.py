@@ -0,0 +1,106 @@
+import csv
+import math
+import os
+from typing import NamedTuple
+from chunking import count_tokens
+
+# Input methods read as tables: rows are grouped into chunks instead of being split as text
+TABLE_METHODS = ("csv", "xlsx")
+
+# Bytes read from the start of a table to estimate its row count for sampling
+SAMPLE_ESTIMATE_BYTES = 1024 * 1024
+
+
+# Where to resume reading a CSV file: the byte offset of the next record, the spreadsheet row number
+# of the last record read (the header is row 1), the rows kept so far and the sampling stride
+class TableCursor(NamedTuple):
+    offset: int = 0
+    row: int = 1
+    kept: int = 0
+    stride: int = 0
+
+def format_row(record: list) -> str:
+    return " | ".join(" ".join(field.split()) for field in record)
+
+# Decode a binary file line by line, so the file position after each record is known without a text
+# layer's read-ahead and undecodable bytes don't stop the read
+def decode_lines(table):
+    for line in iter(table.readline, b""):
+        yield line.decode("utf-8", errors="replace")
+
+# Keep every stride-th row so that about sample_rows rows are spread over the whole file, estimating
+# the row count from the line density of the first megabyte
+def sampling_stride(table, data_start: int, sample_rows: int) -> int:
+    if not sample_rows:
+        return 1
+    size = os.fstat(table.fileno()).st_size - data_start
+    table.seek(data_start)
+    head = table.read(SAMPLE_ESTIMATE_BYTES)
+    table.seek(data_start)
+    if not head:
+        return 1
+    estimated_rows = size * max(head.count(b"\n"), 1) / len(head)
+    return max(math.ceil(estimated_rows / sample_rows), 1)
+
+# Read up to max_chunks chunks of a CSV file from the cursor: consecutive rows of up to chunk_tokens
+# each, starting with the header row so every chunk names its columns. Returns the chunks as (text,
+# first row, last row) and the cursor to continue from, or None at the end of the file. With
+# sample_rows, only about that many rows, spread evenly over the file, are read. Only one batch of
+# chunks is held in memory, however large the file.
+def read_csv_chunks(path: str, cursor: TableCursor, chunk_tokens: int, sample_rows: int, max_chunks: int) -> tuple:
+    with open(path, "rb") as table:
+        reader = csv.reader(decode_lines(table))
+        header = next(reader, None)
+        if header is None:
+            return [], None
+        header[0] = header[0].lstrip("\ufeff")
+        head = format_row(header)
+        stride = cursor.stride or sampling_stride(table, table.tell(), sample_rows)
+        if cursor.offset:
+            table.seek(cursor.offset)
+        budget = max(chunk_tokens - count_tokens(head), 1)
+
+        chunks = []
+        rows = []
+        tokens = 0
+        row, kept = cursor.row, cursor.kept
+        position = table.tell()
+
+        def close():
+            chunks.append((head + "\n" + "\n".join(text for text, _ in rows) + "\n", rows[0][1], rows[-1][1]))
+
+        for record in reader:
+            row += 1
+            if sample_rows and kept >= sample_rows:
+                break
+            if not any(field.strip() for field in record) or (row - 2) % stride:
+                position = table.tell()
+                continue
+            text = format_row(record)
+            size = count_tokens(text)
+            if rows and tokens + size > budget:
+                close()
+                rows, tokens = [], 0
+                if len(chunks) >= max_chunks:
+                    # Resume at this record
+                    return chunks, TableCursor(position, row - 1, kept, stride)
+            rows.append((text, row))
+            tokens += size
+            kept += 1
+            position = table.tell()
+        if rows:
+            close()
+        return chunks, None
+
+# Write the first worksheet of an XLSX workbook to a CSV file, streaming the rows with openpyxl's
+# read-only reader so the sheet is never loaded whole
+def xlsx_to_csv(path: str, csv_path: str):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        with open(csv_path, "w", encoding="utf-8", newline="") as output:
+            writer = csv.writer(output)
+            for values in workbook.worksheets[0].iter_rows(values_only=True):
+                writer.writerow(["" if value is None else str(value) for value in values])
+    finally:
+        workbook.close()
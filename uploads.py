@@ -0,0 +1,159 @@
+import codecs
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+from starlette.responses import JSONResponse
+
+# Bytes copied or decoded at a time when spooling and reading inputs, so no input is held whole in memory
+SPOOL_BLOCK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload passes its size limit while it is being spooled."""
+
+
+class MappedFile(mmap.mmap):
+    """A read-only memory map that passes for a seekable binary file, as zipfile (PPTX, DOCX) expects."""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return False
+
+# Open a file for a parser as a read-only memory map, so the parser reads the shared page cache instead
+# of a private copy of the file. Empty files can't be mapped and are opened normally.
+@contextmanager
+def open_mapped(path: str):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield file
+            return
+        mapping = map_file(file)
+        try:
+            yield mapping
+        finally:
+            mapping.close()
+
+def map_file(file) -> MappedFile:
+    return MappedFile(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(SPOOL_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Upload:
+    """The input of one document: a file on disk (uploads are spooled there) or a short text held in
+    memory, with its size and the SHA-256 digest of its content, which stands in for it in cache keys.
+
+    File inputs are handed to extraction workers by path, so they never cross a process boundary as
+    bytes. An owned file is a spooled copy and is deleted by close().
+    """
+
+    def __init__(self, path: Optional[str] = None, data: Optional[bytes] = None, size: int = 0, digest: str = "",
+                 owned: bool = False):
+        self.path = path
+        self.data = data
+        self.size = size
+        self.digest = digest
+        self.owned = owned
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Upload":
+        return cls(data=data, size=len(data), digest=hashlib.sha256(data).hexdigest())
+
+    # An existing file, read in place; it is left on disk by close()
+    @classmethod
+    def from_file(cls, path: str) -> "Upload":
+        return cls(path=path, size=os.path.getsize(path), digest=file_digest(path))
+
+    def open(self):
+        return open(self.path, "rb") if self.path is not None else io.BytesIO(self.data)
+
+    # The whole input as text; for short inputs such as video ids
+    def text(self) -> str:
+        return "".join(self.iter_text())
+
+    # The input as UTF-8 text, a block at a time
+    def iter_text(self):
+        if self.path is None:
+            yield self.data.decode("utf-8")
+            return
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(self.path, "rb") as file:
+            for block in iter(lambda: file.read(SPOOL_BLOCK_BYTES), b""):
+                yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+
+    # Store the input at `path`. An owned file is moved there (renamed, without copying, on the same
+    # file system) and is no longer owned.
+    def save(self, path: str):
+        if self.path is None:
+            with open(path, "wb") as file:
+                file.write(self.data)
+            return
+        if self.owned:
+            shutil.move(self.path, path)
+            self.path, self.owned = path, False
+        else:
+            shutil.copyfile(self.path, path)
+
+    def close(self):
+        if self.owned and self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.owned = False
+
+# Copy a binary file object to a new file in `directory` a block at a time, hashing it on the way.
+# Raises UploadTooLarge, leaving nothing behind, once more than `limit` bytes (0 for no limit) are read.
+def spool(source, directory: str, limit: int, suffix: str = "") -> Upload:
+    os.makedirs(directory, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(descriptor, "wb") as spooled:
+            for block in iter(lambda: source.read(SPOOL_BLOCK_BYTES), b""):
+                size += len(block)
+                if limit and size > limit:
+                    raise UploadTooLarge(f"The upload is larger than {limit} bytes")
+                digest.update(block)
+                spooled.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return Upload(path=path, size=size, digest=digest.hexdigest(), owned=True)
+
+
+class RequestSizeLimit:
+    """ASGI middleware refusing with a 413 any request that declares a body larger than its path's limit
+    in `limits`, or `limit` for other paths (0 for no limit), before any of the body is read or spooled."""
+
+    def __init__(self, app, limit: int, limits: Optional[dict] = None):
+        self.app = app
+        self.limit = limit
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path"), self.limit) if scope["type"] == "http" else 0
+        if limit:
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > limit:
+                response = JSONResponse({"detail": "The request is too large."}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
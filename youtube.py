@@ -0,0 +1,138 @@
+import asyncio
+import importlib
+import json
+import os
+import re
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+from cache import ResultCache
+from chunking import count_tokens
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+# Video id from a YouTube link (watch, youtu.be, shorts, embed or live) or a bare id; None if there is none
+def parse_video_id(value: str) -> Optional[str]:
+    value = value.strip()
+    if _VIDEO_ID.match(value):
+        return value
+    parsed = urlparse(value if "://" in value else "https://" + value)
+    host = parsed.hostname or ""
+    if host == "youtu.be":
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        parts = parsed.path.strip("/").split("/")
+        if parts[0] == "watch":
+            candidate = parse_qs(parsed.query).get("v", [""])[0]
+        elif len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            candidate = parts[1]
+        else:
+            return None
+    else:
+        return None
+    return candidate if _VIDEO_ID.match(candidate) else None
+
+def video_url(video_id: str, start: float = 0) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}" + (f"&t={int(start)}s" if start >= 1 else "")
+
+
+class TranscriptUnavailable(Exception):
+    """The video has no transcript that can be fetched: captions disabled, or the video is private or gone."""
+
+
+# Transcript fetchers take a video id and return its segments, each with the text, start and
+# duration in seconds; they run in a thread, so they may block.
+
+# YouTube's own captions, through youtube-transcript-api (imported on first use)
+def fetch_from_youtube(video_id: str) -> list:
+    from youtube_transcript_api import CouldNotRetrieveTranscript, YouTubeTranscriptApi
+    try:
+        return YouTubeTranscriptApi.get_transcript(video_id)
+    except CouldNotRetrieveTranscript as e:
+        raise TranscriptUnavailable(str(e)) from e
+
+# Local stand-in for testing without network access: TRANSCRIPT_DIR/<video id>.json holds the segments
+def fetch_from_directory(video_id: str) -> list:
+    path = os.path.join(os.getenv("TRANSCRIPT_DIR", "transcripts"), f"{video_id}.json")
+    if not os.path.exists(path):
+        raise TranscriptUnavailable(f"No transcript file for {video_id}")
+    with open(path, encoding="utf-8") as transcript_file:
+        return json.load(transcript_file)
+
+# Fetcher named as "module:function"
+def load_fetcher(path: str) -> Callable:
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+# Segments as plain dicts with whitespace collapsed, dropping empty ones. Fetchers may return dicts
+# or objects with text, start and duration attributes.
+def normalize_segments(segments) -> list:
+    normalized = []
+    for segment in segments:
+        if not isinstance(segment, dict):
+            segment = {"text": segment.text, "start": segment.start, "duration": segment.duration}
+        text = " ".join(str(segment.get("text") or "").split())
+        if text:
+            normalized.append({"text": text, "start": float(segment["start"]), "duration": float(segment.get("duration") or 0)})
+    return normalized
+
+
+class TranscriptStore:
+    """Transcripts by video id, fetched once and kept in a ResultCache. Concurrent requests for the same video share one fetch."""
+
+    def __init__(self, cache: ResultCache, fetcher: Callable):
+        self.cache = cache
+        self.fetcher = fetcher
+        self.fetching = {}
+        self.fetches = 0
+
+    async def get(self, video_id: str) -> list:
+        cached = self.cache.get(video_id)
+        if cached is not None:
+            return cached["segments"]
+        task = self.fetching.get(video_id)
+        if task is None:
+            task = self.fetching[video_id] = asyncio.ensure_future(self._fetch(video_id))
+            task.add_done_callback(lambda _: self.fetching.pop(video_id, None))
+        # One waiting request going away must not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, video_id: str) -> list:
+        self.fetches += 1
+        segments = normalize_segments(await asyncio.to_thread(self.fetcher, video_id))
+        if not segments:
+            raise TranscriptUnavailable("The transcript is empty")
+        self.cache.put(video_id, {"segments": segments})
+        return segments
+
+# Group consecutive segments into chunks of up to chunk_tokens without splitting a segment, each chunk
+# starting with the last segments of the previous one, up to overlap_tokens. Every chunk records the
+# time span it covers.
+def segment_chunks(segments: list, chunk_tokens: int, overlap_tokens: int) -> list:
+    chunks = []
+    current = []
+    tokens = 0
+
+    def close():
+        chunks.append({
+            "text": " ".join(segment["text"] for segment, _ in current),
+            "start": current[0][0]["start"],
+            "end": max(segment["start"] + segment["duration"] for segment, _ in current),
+        })
+
+    for segment in segments:
+        size = count_tokens(segment["text"])
+        if current and tokens + size > chunk_tokens:
+            close()
+            carried = []
+            carried_tokens = 0
+            for previous, previous_size in reversed(current[1:]):
+                if carried_tokens + previous_size > overlap_tokens or carried_tokens + previous_size + size > chunk_tokens:
+                    break
+                carried.insert(0, (previous, previous_size))
+                carried_tokens += previous_size
+            current, tokens = carried, carried_tokens
+        current.append((segment, size))
+        tokens += size
+    if current:
+        close()
+    return chunks